@@ -2,7 +2,27 @@ import os
 import sys
 import time
 import threading
+import io
 import copy
+import json
+import base64
+import hashlib
+import inspect
+import asyncio
+import argparse
+import bisect
+import heapq
+import math
+import select
+import wave
+import pickle
+import unicodedata
+import logging
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque, OrderedDict
+
+logger = logging.getLogger(__name__)
 
 # Handle PyInstaller
 if getattr(sys, 'frozen', False):
@@ -10,7 +30,7 @@ if getattr(sys, 'frozen', False):
 
 # MIDI imports with fallback
 try:
-    from mido import MidiFile, Message, open_output, get_output_names
+    from mido import MidiFile, MidiTrack, Message, MetaMessage, open_output, get_output_names, bpm2tempo
     MIDI_AVAILABLE = True
 except ImportError:
     MIDI_AVAILABLE = False
@@ -19,6 +39,8 @@ except ImportError:
             self.tracks = []
             self.ticks_per_beat = 480
             self.filename = args[0] if args else "unknown"
+    class MidiTrack(list):
+        pass
     class Message:
         def __init__(self, *args, **kwargs):
             self.type = kwargs.get('type', 'note_on')
@@ -26,11 +48,24 @@ except ImportError:
             self.velocity = kwargs.get('velocity', 100)
             self.channel = kwargs.get('channel', 0)
             self.time = 0
+    class MetaMessage:
+        def __init__(self, *args, **kwargs):
+            self.type = args[0] if args else 'text'
+            self.time = kwargs.get('time', 0)
+    def bpm2tempo(bpm):
+        return int(round(60000000 / bpm))
     def get_output_names():
         return []
     def open_output(name):
         return None
 
+# WebSocket imports with fallback, server mode then only listens on TCP
+try:
+    import websockets
+    WEBSOCKETS_AVAILABLE = True
+except ImportError:
+    WEBSOCKETS_AVAILABLE = False
+
 # TTS imports with fallback
 try:
     from accessible_output2.outputs.auto import Auto
@@ -39,6 +74,12 @@ except ImportError:
         def speak(self, text, interrupt=False):
             pass
 
+# The JAWS, SAPI5 and Window-Eyes outputs are COM objects, the speech thread initializes COM for them
+try:
+    import pythoncom
+except ImportError:
+    pythoncom = None
+
 import wx
 
 # Language strings
@@ -54,19 +95,22 @@ STRINGS = {
         'notes': 'Notes:',
         'lyrics': 'Lyrics:',
         'no_lyrics': 'No lyrics',
+        'split_channels': 'Split tracks by &channel',
+        'channel_word': 'channel',
         'track_properties': 'Track Properties',
         'midi_channel': 'MIDI Channel (1-16):',
         'instrument': 'Instrument (0-127):',
         'bank': 'Bank (0-127):',
         'volume': 'Volume (0-127):',
         'metronome_settings': 'Metronome Settings',
-        'tempo_bpm': 'Tempo (BPM):',
         'downbeat_note': 'Downbeat Note:',
         'upbeat_note': 'Upbeat Note:',
         'enable_metronome': 'Enable Metronome',
+        'announce_settings': 'Announcement Settings',
+        'announce_lead_ms': 'Announce ahead of note (ms):',
         'track_pairs': 'Track Pairs:',
         'status': 'Status:',
-        'controls': 'Space=Play/Pause, Alt+Arrows=Navigate, Home/End=Start/End, F4=Metronome, F6=Auto Announce',
+        'controls': 'Space=Play/Pause, Alt+Left/Right=Navigate, Alt+Up/Down=Bar, PageUp/PageDown=4 bars, Home/End=Start/End, F4=Metronome, F6=Auto Announce, F7/F8=Loop start/end, F9=Loop, Ctrl+Up/Down=Speed, F12/Shift+F12=Next/previous change, F11/Shift+F11=Next/previous problem',
         'open_midi': '&Open MIDI File\tCtrl+O',
         'configure_tracks': '&Configure Tracks\tCtrl+T',
         'clear': '&Clear\tCtrl+C',
@@ -76,6 +120,19 @@ STRINGS = {
         'metronome_settings_menu': '&Metronome Settings\tCtrl+M',
         'toggle_metronome': '&Toggle Metronome\tF4',
         'toggle_auto_announce': '&Toggle Auto Announce\tF6',
+        'announce_settings_menu': 'A&nnouncement Settings',
+        'export_menu': '&Export Pairs...\tCtrl+E',
+        'find_lyric_menu': '&Find Lyric...\tCtrl+F',
+        'find_next_menu': 'Find &Next\tF3',
+        'go_to_bar_menu': '&Go to Bar...\tCtrl+G',
+        'watch_folder_menu': 'W&atch Folder...',
+        'watched_files_menu': 'Watc&hed Files...\tCtrl+W',
+        'open_files_menu': 'Open F&iles...\tCtrl+L',
+        'workspace_memory_menu': 'Open Files &Memory Limit...',
+        'compare_menu': 'Com&pare With Other Version...',
+        'changes_menu': 'Chan&ges...\tCtrl+D',
+        'lint_menu': 'Chec&k Lyrics...\tCtrl+K',
+        'statistics_menu': 'Pair &Statistics\tCtrl+I',
         'quit': '&Quit\tCtrl+Q',
         'file_menu': '&File',
         'language_menu': '&Language',
@@ -83,6 +140,7 @@ STRINGS = {
         'spanish': 'Español',
         'paused': 'Paused',
         'playing': 'Playing',
+        'still_stopping': 'Playback is still stopping, try again',
         'beginning': 'Beginning',
         'end': 'End',
         'position': 'Position',
@@ -104,7 +162,59 @@ STRINGS = {
         'error_accessing_midi': 'Error accessing MIDI devices:',
         'error_loading_midi': 'Error loading MIDI:',
         'open_midi_file': 'Open MIDI file',
-        'midi_files': 'MIDI files (*.mid;*.midi)|*.mid;*.midi',
+        'midi_files': 'MIDI files (*.mid;*.midi;*.kar)|*.mid;*.midi;*.kar',
+        'export_title': 'Export',
+        'export_pairs_prompt': 'Select the pairs to export:',
+        'export_files': 'MIDI files (*.mid)|*.mid|WAV audio (*.wav)|*.wav',
+        'export_done': 'Export finished',
+        'error_exporting': 'Error exporting:',
+        'metronome_track': 'Metronome',
+        'find_lyric_title': 'Find Lyric',
+        'find_lyric_prompt': 'Word to find:',
+        'no_matches': 'No matches',
+        'match': 'Match',
+        'bar': 'Bar',
+        'go_to_bar_title': 'Go to Bar',
+        'go_to_bar_prompt': 'Bar number:',
+        'watch_folder_title': 'Choose a folder to watch',
+        'watching_folder': 'Watching folder',
+        'watched_files_title': 'Watched Files',
+        'watched_files_prompt': 'Files analyzed in the watched folder, files with problems first:',
+        'no_watched_files': 'No files analyzed yet.',
+        'open_files_title': 'Open Files',
+        'open_files_prompt': 'Files kept open, most recent first:',
+        'no_open_files': 'No files open.',
+        'workspace_memory_title': 'Open Files Memory Limit',
+        'workspace_memory_prompt': 'Megabytes for open files, the least recently used are closed first:',
+        'compare_title': 'Choose the other version of the file',
+        'changes_title': 'Changes',
+        'changes_prompt': 'Changes against the other version, in order:',
+        'changes_found': 'changes',
+        'no_changes': 'No changes found',
+        'no_comparison': 'Compare the file with another version first.',
+        'change': 'Change',
+        'now': 'now',
+        'lint_title': 'Lyric Check',
+        'lint_prompt': 'Problems in all pairs, in order:',
+        'problems_found': 'problems',
+        'no_lint': 'Check the lyrics first.',
+        'problem': 'Problem',
+        'lint_no_note': 'syllable without a note',
+        'lint_no_syllable': 'note without a syllable',
+        'lint_out_of_range': 'syllable outside the notes',
+        'lint_doubled': 'doubled syllable',
+        'lint_late': 'late syllable',
+        'note_names': 'C C# D D# E F F# G G# A A# B',
+        'range': 'Range:',
+        'tessitura': 'Tessitura:',
+        'durations': 'Sixteenths/eighths/quarters/halves/longer:',
+        'syllables_per_note': 'Syllables per note:',
+        'longest_melisma': 'Longest melisma:',
+        'from_note': 'from note',
+        'statistics_hidden': 'Statistics hidden',
+        'unaligned_lyrics': 'syllables without a note',
+        'no_problems': 'no problems',
+        'analyzing': 'analyzing',
         'loaded_tracks': 'Loaded',
         'notes_word': 'notes',
         'lyrics_found': 'lyrics',
@@ -121,9 +231,21 @@ STRINGS = {
         'of': 'of',
         'track': 'Track',
         'lyrics_in_pair': 'Lyrics in pair:',
+        'song_title': 'Title:',
+        'session_restored': 'Session restored:',
         'midi_status': 'MIDI:',
         'metronome': 'Metronome:',
         'auto_announce': 'Auto announce:',
+        'speech_stats': 'Speech dropped/delayed/failed:',
+        'timer_stats': 'Timer, mean/worst lateness:',
+        'loop_start_set': 'Loop start: note',
+        'loop_end_set': 'Loop end: note',
+        'loop_on': 'Loop on',
+        'loop_off': 'Loop off',
+        'loop_needs_markers': 'Set the loop start with F7 and the end with F8 first',
+        'loop': 'Loop',
+        'speed': 'Speed',
+        'chord_notes': 'Notes in chord:',
         'on': 'On',
         'off': 'Off',
         'yes': 'Yes',
@@ -140,19 +262,22 @@ STRINGS = {
         'notes': 'Notas:',
         'lyrics': 'Letras:',
         'no_lyrics': 'Sin letras',
+        'split_channels': 'Separar pistas por &canal',
+        'channel_word': 'canal',
         'track_properties': 'Propiedades de Pista',
         'midi_channel': 'Canal MIDI (1-16):',
         'instrument': 'Instrumento (0-127):',
         'bank': 'Banco (0-127):',
         'volume': 'Volumen (0-127):',
         'metronome_settings': 'Configuración de Metrónomo',
-        'tempo_bpm': 'Tempo (BPM):',
         'downbeat_note': 'Nota de Tiempo Fuerte:',
         'upbeat_note': 'Nota de Tiempo Débil:',
         'enable_metronome': 'Activar Metrónomo',
+        'announce_settings': 'Configuración de Anuncios',
+        'announce_lead_ms': 'Anticipar anuncio a la nota (ms):',
         'track_pairs': 'Parejas de Pistas:',
         'status': 'Estado:',
-        'controls': 'Espacio=Reproducir/Pausa, Alt+Flechas=Navegar, Inicio/Fin=Principio/Final, F4=Metrónomo, F6=Activar desactivar Anuncios',
+        'controls': 'Espacio=Reproducir/Pausa, Alt+Izquierda/Derecha=Navegar, Alt+Arriba/Abajo=Compás, RePág/AvPág=4 compases, Inicio/Fin=Principio/Final, F4=Metrónomo, F6=Activar desactivar Anuncios, F7/F8=Inicio/fin de repetición, F9=Repetición, Ctrl+Arriba/Abajo=Velocidad, F12/Mayús+F12=Cambio siguiente/anterior, F11/Mayús+F11=Problema siguiente/anterior',
         'open_midi': '&Abrir Archivo MIDI\tCtrl+O',
         'configure_tracks': '&Configurar Pistas\tCtrl+T',
         'clear': '&Limpiar\tCtrl+C',
@@ -162,6 +287,19 @@ STRINGS = {
         'metronome_settings_menu': '&Configuración de Metrónomo\tCtrl+M',
         'toggle_metronome': '&Alternar Metrónomo\tF4',
         'toggle_auto_announce': '&Alternar Anuncios\tF6',
+        'announce_settings_menu': 'Co&nfiguración de Anuncios',
+        'export_menu': '&Exportar Parejas...\tCtrl+E',
+        'find_lyric_menu': '&Buscar Letra...\tCtrl+F',
+        'find_next_menu': 'Buscar &Siguiente\tF3',
+        'go_to_bar_menu': '&Ir a Compás...\tCtrl+G',
+        'watch_folder_menu': 'Vigilar &Carpeta...',
+        'watched_files_menu': 'Archivos &Vigilados...\tCtrl+W',
+        'open_files_menu': 'Archivos Abier&tos...\tCtrl+L',
+        'workspace_memory_menu': 'Límite de &Memoria de Archivos Abiertos...',
+        'compare_menu': 'Com&parar con Otra Versión...',
+        'changes_menu': 'Camb&ios...\tCtrl+D',
+        'lint_menu': 'Re&visar Letras...\tCtrl+K',
+        'statistics_menu': '&Estadísticas de Pareja\tCtrl+I',
         'quit': '&Salir\tCtrl+Q',
         'file_menu': '&Archivo',
         'language_menu': '&Idioma - language',
@@ -169,6 +307,7 @@ STRINGS = {
         'spanish': 'Español',
         'paused': 'Pausado',
         'playing': 'Reproduciendo',
+        'still_stopping': 'La reproducción aún se está deteniendo, inténtelo de nuevo',
         'beginning': 'Principio',
         'end': 'Final',
         'position': 'Posición',
@@ -190,7 +329,59 @@ STRINGS = {
         'error_accessing_midi': 'Error al acceder a dispositivos MIDI:',
         'error_loading_midi': 'Error al cargar MIDI:',
         'open_midi_file': 'Abrir archivo MIDI',
-        'midi_files': 'Archivos MIDI (*.mid;*.midi)|*.mid;*.midi',
+        'midi_files': 'Archivos MIDI (*.mid;*.midi;*.kar)|*.mid;*.midi;*.kar',
+        'export_title': 'Exportar',
+        'export_pairs_prompt': 'Selecciona las parejas a exportar:',
+        'export_files': 'Archivos MIDI (*.mid)|*.mid|Audio WAV (*.wav)|*.wav',
+        'export_done': 'Exportación terminada',
+        'error_exporting': 'Error al exportar:',
+        'metronome_track': 'Metrónomo',
+        'find_lyric_title': 'Buscar Letra',
+        'find_lyric_prompt': 'Palabra a buscar:',
+        'no_matches': 'Sin coincidencias',
+        'match': 'Coincidencia',
+        'bar': 'Compás',
+        'go_to_bar_title': 'Ir a Compás',
+        'go_to_bar_prompt': 'Número de compás:',
+        'watch_folder_title': 'Elige una carpeta para vigilar',
+        'watching_folder': 'Vigilando carpeta',
+        'watched_files_title': 'Archivos Vigilados',
+        'watched_files_prompt': 'Archivos analizados en la carpeta vigilada, primero los que tienen problemas:',
+        'no_watched_files': 'Todavía no hay archivos analizados.',
+        'open_files_title': 'Archivos Abiertos',
+        'open_files_prompt': 'Archivos abiertos, el más reciente primero:',
+        'no_open_files': 'No hay archivos abiertos.',
+        'workspace_memory_title': 'Límite de Memoria de Archivos Abiertos',
+        'workspace_memory_prompt': 'Megabytes para archivos abiertos, se cierran primero los usados hace más tiempo:',
+        'compare_title': 'Elija la otra versión del archivo',
+        'changes_title': 'Cambios',
+        'changes_prompt': 'Cambios respecto a la otra versión, en orden:',
+        'changes_found': 'cambios',
+        'no_changes': 'No se encontraron cambios',
+        'no_comparison': 'Primero compare el archivo con otra versión.',
+        'change': 'Cambio',
+        'now': 'ahora',
+        'lint_title': 'Revisión de Letras',
+        'lint_prompt': 'Problemas en todas las parejas, en orden:',
+        'problems_found': 'problemas',
+        'no_lint': 'Primero revise las letras.',
+        'problem': 'Problema',
+        'lint_no_note': 'sílaba sin nota',
+        'lint_no_syllable': 'nota sin sílaba',
+        'lint_out_of_range': 'sílaba fuera de las notas',
+        'lint_doubled': 'sílaba duplicada',
+        'lint_late': 'sílaba tardía',
+        'note_names': 'Do Do# Re Re# Mi Fa Fa# Sol Sol# La La# Si',
+        'range': 'Extensión:',
+        'tessitura': 'Tesitura:',
+        'durations': 'Semicorcheas/corcheas/negras/blancas/más largas:',
+        'syllables_per_note': 'Sílabas por nota:',
+        'longest_melisma': 'Melisma más largo:',
+        'from_note': 'desde la nota',
+        'statistics_hidden': 'Estadísticas ocultas',
+        'unaligned_lyrics': 'sílabas sin nota',
+        'no_problems': 'sin problemas',
+        'analyzing': 'analizando',
         'loaded_tracks': 'Cargado',
         'notes_word': 'notas',
         'lyrics_found': 'letras',
@@ -207,9 +398,21 @@ STRINGS = {
         'of': 'de',
         'track': 'Pista',
         'lyrics_in_pair': 'Letras en pareja:',
+        'song_title': 'Título:',
+        'session_restored': 'Sesión restaurada:',
         'midi_status': 'MIDI:',
         'metronome': 'Metrónomo:',
         'auto_announce': 'Anuncio de letras:',
+        'speech_stats': 'Anuncios descartados/retrasados/fallidos:',
+        'timer_stats': 'Temporizador, retraso medio/máximo:',
+        'loop_start_set': 'Inicio de repetición: nota',
+        'loop_end_set': 'Fin de repetición: nota',
+        'loop_on': 'Repetición activada',
+        'loop_off': 'Repetición desactivada',
+        'loop_needs_markers': 'Primero marque el inicio de la repetición con F7 y el fin con F8',
+        'loop': 'Repetición',
+        'speed': 'Velocidad',
+        'chord_notes': 'Notas del acorde:',
         'on': 'Activado',
         'off': 'Desactivado',
         'yes': 'Sí',
@@ -231,134 +434,2089 @@ class LanguageManager:
 # Global language manager
 lang = LanguageManager()
 
-class TrackPairingDialog(wx.Dialog):
-    def __init__(self, parent, track_info):
-        super().__init__(parent, title=lang.get('track_config'), size=(500, 400))
-        self.track_info = track_info
-        self.track_pairs = []
-        
-        # Create filtered lists for selection
-        self.notes_tracks = []  # Tracks with notes
-        self.lyrics_tracks = []  # Tracks with lyrics (or option for no lyrics)
-        
-        # Filter tracks with notes for notes selection
-        for i, (name, has_notes, has_lyrics) in enumerate(track_info):
-            if has_notes:
-                self.notes_tracks.append((i, name))
+class SpeechQueue:
+    """Speaks announcements on a worker thread so slow screen reader backends never block the UI.
+    The backend is created by create_backend on that thread, since COM based outputs only work
+    on the thread that created them."""
+    def __init__(self, create_backend, max_pending=8, delay_threshold=0.25):
+        self.create_backend = create_backend
+        self.backend = None
+        self.max_pending = max_pending
+        self.delay_threshold = delay_threshold  # Seconds waiting before an announcement counts as delayed
+        self.pending = deque()
+        self.condition = threading.Condition()
+        self.dropped = 0
+        self.delayed = 0
+        self.failed = 0  # Announcements the backend could not speak
+        self.running = True
+        self.worker = threading.Thread(target=self._speak_pending, daemon=True)
+        self.worker.start()
+
+    def speak(self, text, interrupt=False, droppable=False):
+        """Queue an announcement. Interrupt discards everything pending, a droppable
+        announcement (such as a lyric) replaces any droppable one not yet spoken"""
+        with self.condition:
+            if interrupt:
+                self.dropped += len(self.pending)
+                self.pending.clear()
+            elif droppable:
+                kept = deque(item for item in self.pending if not item[2])
+                self.dropped += len(self.pending) - len(kept)
+                self.pending = kept
+            
+            # Bounded queue, the oldest announcement goes first
+            if len(self.pending) >= self.max_pending:
+                self.pending.popleft()
+                self.dropped += 1
+            
+            self.pending.append((text, interrupt, droppable, time.time()))
+            self.condition.notify()
+
+    def get_stats(self):
+        return self.dropped, self.delayed, self.failed
+
+    def stop(self):
+        with self.condition:
+            self.running = False
+            self.pending.clear()
+            self.condition.notify()
+
+    def _speak_pending(self):
+        if pythoncom is not None:
+            pythoncom.CoInitialize()
+        try:
+            self.backend = self.create_backend()
+        except Exception:
+            self.backend = None
+        try:
+            while True:
+                with self.condition:
+                    while self.running and not self.pending:
+                        self.condition.wait()
+                    if not self.running:
+                        return
+                    text, interrupt, _, queued_time = self.pending.popleft()
+                
+                if time.time() - queued_time > self.delay_threshold:
+                    self.delayed += 1
+                try:
+                    self.backend.speak(text, interrupt=interrupt)
+                except Exception:
+                    self.failed += 1
+        finally:
+            if pythoncom is not None:
+                pythoncom.CoUninitialize()
+
+class MidiPortManager:
+    """Enumerates MIDI output devices once in the background and keeps recently used
+    ports open, so switching back to a previous device is instant.
+    The backend functions can be replaced, for example by fakes in tests."""
+    PREFERRED_PORTS = ['Microsoft GS Wavetable Synth', 'Windows MIDI', 'MIDI Mapper', 'Wavetable']
+
+    def __init__(self, list_ports=get_output_names, open_port=open_output, pool_size=3):
+        self.list_ports = list_ports
+        self.open_port = open_port
+        self.pool_size = pool_size
+        self.port_names = []
+        self.enumerated = threading.Event()
+        self.open_ports = OrderedDict()  # Port name -> open port, most recently used last
+        self.current_name = None
+        self.lock = threading.Lock()
+
+    def start_enumeration(self, on_done=None):
+        """Enumerate devices on a background thread, on_done is called from that thread"""
+        def _enumerate():
+            self.refresh_port_names()
+            if on_done:
+                on_done()
+        threading.Thread(target=_enumerate, daemon=True).start()
+
+    def refresh_port_names(self):
+        try:
+            self.port_names = list(self.list_ports())
+        except Exception:
+            self.port_names = []
+        self.enumerated.set()
+        return self.port_names
+
+    def get_port_names(self):
+        if not self.enumerated.is_set():
+            return self.refresh_port_names()
+        return self.port_names
+
+    def get_default_port_name(self):
+        """Pick a preferred Windows synth if present, otherwise the first device"""
+        for candidate in self.PREFERRED_PORTS:
+            for port in self.port_names:
+                if candidate.lower() in port.lower():
+                    return port
+        return self.port_names[0] if self.port_names else None
+
+    def select(self, name):
+        """Get an open port for a device, reusing the pooled one when available"""
+        with self.lock:
+            port = self.open_ports.pop(name, None)
+            if port is None:
+                port = self.open_port(name)
+            
+            # Silence the device we are leaving, it stays open in the pool
+            previous = self.open_ports.get(self.current_name)
+            if previous is not None:
+                try:
+                    for ch in range(16):
+                        previous.send(Message('control_change', channel=ch, control=123, value=0))
+                except:
+                    pass
+            
+            self.open_ports[name] = port
+            self.current_name = name
+            
+            # Close the least recently used ports beyond the pool size
+            while len(self.open_ports) > self.pool_size:
+                _, old_port = self.open_ports.popitem(last=False)
+                try:
+                    old_port.close()
+                except:
+                    pass
+            return port
+
+    def close_all(self):
+        with self.lock:
+            for port in self.open_ports.values():
+                try:
+                    port.close()
+                except:
+                    pass
+            self.open_ports.clear()
+            self.current_name = None
+
+class TempoMap:
+    """Converts absolute ticks to seconds across the tempo changes of a file"""
+    def __init__(self, ticks_per_beat, tempo_changes):
+        self.ticks_per_beat = ticks_per_beat
+        # Segment starts: tick, seconds elapsed at that tick and the BPM from there on
+        self.ticks = [0]
+        self.seconds = [0.0]
+        self.bpms = [120]
         
-        # Filter tracks with lyrics for lyrics selection, plus "No lyrics" option
-        for i, (name, has_notes, has_lyrics) in enumerate(track_info):
-            if has_lyrics:
-                self.lyrics_tracks.append((i, name))
-        # Always add "No lyrics" option at the end
-        self.lyrics_tracks.append((None, lang.get('no_lyrics')))
+        for tick, bpm in tempo_changes:
+            if tick == self.ticks[-1]:
+                self.bpms[-1] = bpm
+            else:
+                self.seconds.append(self.tick_to_seconds(tick))
+                self.ticks.append(tick)
+                self.bpms.append(bpm)
+
+    def tick_to_seconds(self, tick):
+        segment = max(0, bisect.bisect_right(self.ticks, tick) - 1)
+        beats = (tick - self.ticks[segment]) / self.ticks_per_beat
+        return self.seconds[segment] + beats * 60.0 / self.bpms[segment]
+
+# Playback plans kept for switching back and forth between pairs and files
+PLAN_CACHE_SIZE = 8
+
+# Practice speeds, as factors of the tempo of the file
+MIN_SPEED = 0.5
+MAX_SPEED = 1.5
+SPEED_STEP = 0.1
+
+class SleepTimer:
+    """Waits with time.sleep, cheap but only as accurate as the scheduler of the system.
+    Timers wait until a deadline on time.perf_counter"""
+    name = 'sleep'
+
+    def available(self):
+        return True
+
+    def sleep(self, seconds):
+        time.sleep(seconds)
+
+    def sleep_until(self, deadline):
+        remaining = deadline - time.perf_counter()
+        if remaining > 0:
+            self.sleep(remaining)
+
+    def close(self):
+        """Free what the calling thread used for waiting, called as the thread ends"""
+        pass
+
+class SpinTimer(SleepTimer):
+    """Sleeps until shortly before the deadline and spins for the rest, accurate but costs CPU"""
+    name = 'sleep_spin'
+
+    def __init__(self, margin=0.002):
+        self.margin = margin
+
+    def sleep_until(self, deadline):
+        remaining = deadline - time.perf_counter() - self.margin
+        if remaining > 0:
+            time.sleep(remaining)
+        while time.perf_counter() < deadline:
+            pass
+
+class EventTimer(SleepTimer):
+    """Waits on a threading.Event that is never set, its timeout uses a different wait of the system"""
+    name = 'event'
+
+    def __init__(self):
+        self.event = threading.Event()
+
+    def sleep(self, seconds):
+        self.event.wait(seconds)
+
+class SelectTimer(SleepTimer):
+    """Waits in select with no file descriptors, not usable on Windows"""
+    name = 'select'
+
+    def available(self):
+        return sys.platform != 'win32'
+
+    def sleep(self, seconds):
+        select.select([], [], [], seconds)
+
+class TimerfdTimer(SleepTimer):
+    """Waits on a Linux timerfd, one per thread, available from Python 3.13"""
+    name = 'timerfd'
+
+    def __init__(self):
+        self.local = threading.local()
+
+    def available(self):
+        return hasattr(os, 'timerfd_create')
+
+    def sleep(self, seconds):
+        fd = getattr(self.local, 'fd', None)
+        if fd is None:
+            fd = self.local.fd = os.timerfd_create(time.CLOCK_MONOTONIC)
+        os.timerfd_settime(fd, initial=max(seconds, 1e-6))
+        os.read(fd, 8)
+
+    def close(self):
+        fd = getattr(self.local, 'fd', None)
+        if fd is not None:
+            os.close(fd)
+            self.local.fd = None
+
+# Timer calibration: waits measured per backend, their length, and the share of
+# a CPU a backend may use while waiting
+TIMER_SAMPLES = 20
+TIMER_INTERVAL = 0.01
+TIMER_CPU_BUDGET = 0.25
+# Waits are left to the timer only for their last milliseconds, before that they can be
+# cut short by stopping playback
+TIMER_FINE_WAIT = 0.005
+
+def measure_timer(timer, samples=TIMER_SAMPLES, interval=TIMER_INTERVAL):
+    """Get the mean overshoot in seconds of a timer and the share of a CPU it used waiting"""
+    overshoot = 0.0
+    wall_start = time.perf_counter()
+    cpu_start = time.thread_time()
+    for _ in range(samples):
+        deadline = time.perf_counter() + interval
+        timer.sleep_until(deadline)
+        overshoot += time.perf_counter() - deadline
+    wall = time.perf_counter() - wall_start
+    cpu = time.thread_time() - cpu_start
+    return overshoot / samples, cpu / wall if wall > 0 else 0.0
+
+def choose_timer(timers=None, cpu_budget=TIMER_CPU_BUDGET):
+    """Measure the available timers and pick the most accurate one within the CPU budget.
+    Returns the timer and {name: (overshoot, cpu share)} of every timer measured"""
+    if timers is None:
+        timers = [SleepTimer(), SpinTimer(), EventTimer(), SelectTimer(), TimerfdTimer()]
+    best = SleepTimer()
+    best_overshoot = None
+    measurements = {}
+    for timer in timers:
+        try:
+            if not timer.available():
+                continue
+            overshoot, cpu = measure_timer(timer)
+        except Exception:
+            continue
+        finally:
+            timer.close()
+        measurements[timer.name] = (overshoot, cpu)
+        if cpu <= cpu_budget and (best_overshoot is None or overshoot < best_overshoot):
+            best, best_overshoot = timer, overshoot
+    return best, measurements
+
+class LatenessStats:
+    """How late playback events were sent against their deadlines"""
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.count = 0
+        self.total = 0.0
+        self.worst = 0.0
+
+    def add(self, lateness):
+        self.count += 1
+        self.total += lateness
+        self.worst = max(self.worst, lateness)
+
+    def get_stats(self):
+        """Get (events, mean lateness, worst lateness) in seconds"""
+        return self.count, self.total / self.count if self.count else 0.0, self.worst
+
+class PlaybackRun:
+    """Stop event and sounding notes of one playback thread"""
+    def __init__(self):
+        self.stop_event = threading.Event()
+        self.active_notes = set()  # (channel, note) sent on and not yet off
+
+class PlaybackController:
+    """Runs playback on one thread at a time, going from stopped to playing and back through stopping.
+    Stopping wakes the waiting thread at once and joins it, on its way out the thread releases
+    the notes it left sounding, so nothing hangs and no two playbacks overlap. A thread that
+    outlives the join, for example stuck sending to a slow device, keeps the controller stopping
+    and no new playback starts until it ends."""
+    STOPPED = 'stopped'
+    PLAYING = 'playing'
+    STOPPING = 'stopping'
+
+    def __init__(self, send=None, on_exit=None):
+        self.send = send  # Sends a message to the output device, may raise
+        self.on_exit = on_exit  # Called on every playback thread as it ends
+        self.state = self.STOPPED
+        self.run = None  # Run of the latest thread
+        self.thread = None
+        self.local = threading.local()  # Run of the calling playback thread
+        self.lock = threading.Lock()
+
+    def start(self, target):
+        """Stop the playback still running, if any, then call target on a new thread.
+        Returns False without starting if the previous thread did not end in time."""
+        if not self.stop():
+            return False
+        with self.lock:
+            self.run = PlaybackRun()
+            self.state = self.PLAYING
+            self.thread = threading.Thread(target=self._run, args=(target, self.run), daemon=True)
+            self.thread.start()
+        return True
+
+    def _run(self, target, run):
+        self.local.run = run
+        try:
+            target()
+        finally:
+            self.release_notes()
+            if self.on_exit:
+                self.on_exit()
+            run.stop_event.set()
+            with self.lock:
+                if self.run is run:
+                    self.state = self.STOPPED
+
+    def stop(self, timeout=1.0):
+        """Stop playback and wait for its thread to release its notes and end.
+        Returns False if the thread is still running after the timeout."""
+        with self.lock:
+            thread = self.thread
+            if self.state == self.PLAYING:
+                self.state = self.STOPPING
+            if self.run is not None:
+                self.run.stop_event.set()
+        if thread is None or thread is threading.current_thread():
+            return True
+        thread.join(timeout)
+        return not thread.is_alive()
+
+    def current_run(self):
+        """The run of the calling playback thread, or of the latest one elsewhere"""
+        return getattr(self.local, 'run', None) or self.run
+
+    def is_playing(self):
+        run = self.current_run()
+        return run is not None and not run.stop_event.is_set()
+
+    def wait(self, seconds):
+        """Sleep up to seconds, returns False at once when playback is stopped"""
+        run = self.current_run()
+        return run is not None and not run.stop_event.wait(seconds)
+
+    def send_message(self, msg):
+        """Send a message, keeping track of the notes it leaves sounding"""
+        try:
+            self.send(msg)
+        except Exception:
+            pass  # Continue playing even if individual messages fail
+        active_notes = self.current_run().active_notes
+        if msg.type == 'note_on' and msg.velocity > 0:
+            active_notes.add((msg.channel, msg.note))
+        elif msg.type in ('note_on', 'note_off'):
+            active_notes.discard((msg.channel, msg.note))
+
+    def release_notes(self):
+        """Send note offs for the notes still sounding, and only for those"""
+        run = self.current_run()
+        if run is None:
+            return
+        for channel, note in run.active_notes:
+            try:
+                self.send(Message('note_off', channel=channel, note=note, velocity=0))
+            except Exception:
+                pass
+        run.active_notes.clear()
+
+class PlaybackClock:
+    """Maps song seconds, from a TempoMap, to wall time at a speed that can change while playing"""
+    def __init__(self, song_seconds, speed=1.0, delay=0.0):
+        # Timer time, on time.perf_counter, at which the song is at song_seconds
+        self.start = time.perf_counter() + delay
+        self.song_seconds = song_seconds
+        self.speed = speed
+
+    def deadline(self, song_seconds):
+        return self.start + (song_seconds - self.song_seconds) / self.speed
+
+    def position(self, now):
+        return self.song_seconds + max(0.0, now - self.start) * self.speed
+
+    def set_speed(self, speed):
+        """Change the speed from the current position on, later events are rescheduled by it"""
+        now = time.perf_counter()
+        self.song_seconds = self.position(now)
+        self.start = max(now, self.start)
+        self.speed = speed
+
+    def jump(self, from_seconds, to_seconds):
+        """Continue at to_seconds from the moment the song reaches from_seconds"""
+        self.start = self.deadline(from_seconds)
+        self.song_seconds = to_seconds
+
+def build_metronome_grid(time_signatures, ticks_per_beat, end_tick):
+    """Get (tick, beat_ticks, is_downbeat) for every beat up to end_tick.
+    Beats follow the time signature denominator and bars restart at every time signature change."""
+    if not time_signatures or time_signatures[0][0] > 0:
+        time_signatures = [(0, 4, 4)] + list(time_signatures)
+    
+    grid = []
+    for i, (sig_tick, numerator, denominator) in enumerate(time_signatures):
+        segment_end = time_signatures[i + 1][0] if i + 1 < len(time_signatures) else end_tick
+        beat_ticks = max(1, ticks_per_beat * 4 // denominator)
+        tick = sig_tick
+        beat = 0
+        while tick < min(segment_end, end_tick):
+            grid.append((tick, beat_ticks, beat % numerator == 0))
+            tick += beat_ticks
+            beat += 1
+    return grid
+
+def channel_state_snapshot(track, start_tick):
+    """Get the program, controller and pitch bend messages in effect at start_tick,
+    so playback starting there sounds as if the track had been played from the beginning"""
+    state = OrderedDict()
+    abs_time = 0
+    for msg in track:
+        abs_time += msg.time
+        if abs_time >= start_tick:
+            break
+        if msg.type == 'control_change':
+            state[(msg.type, msg.channel, msg.control)] = msg
+        elif msg.type in ('program_change', 'pitchwheel', 'aftertouch'):
+            state[(msg.type, msg.channel)] = msg
+    return [msg.copy(time=0) for msg in state.values()]
+
+def property_setup_messages(properties):
+    """Messages setting up the channel of a pair per its track properties, bank select must come before the program"""
+    if not properties:
+        return []
+    channel = properties['channel']
+    messages = []
+    if properties['bank'] > 0:
+        messages.append(Message('control_change', channel=channel, control=0, value=properties['bank']))
+    messages.append(Message('program_change', channel=channel, program=properties['instrument']))
+    messages.append(Message('control_change', channel=channel, control=7, value=properties['volume']))
+    return messages
+
+def build_playback_events(track, lyrics, properties, metronome_grid, metronome_notes, start_tick=0, setup=True):
+    """Build the (tick, kind, payload) events of one pair from start_tick on, in time order.
+    This is the single event pipeline used by live playback and by export, kinds are:
+    'message' a MIDI message remapped per track properties, 'click' a metronome note on/off
+    and 'lyric' the text of a syllable. setup=False leaves out the channel state at start_tick."""
+    events = []
+    
+    # Channel state of the skipped part first, so the track properties below still override it
+    if setup:
+        for msg in channel_state_snapshot(track, start_tick) if start_tick > 0 else []:
+            if properties:
+                msg = msg.copy(channel=properties['channel'])
+            events.append((start_tick, 'message', msg))
         
-        self.init_ui()
+        # Track properties are set up at the start
+        for msg in property_setup_messages(properties):
+            events.append((start_tick, 'message', msg))
+    
+    abs_time = 0
+    for msg in track:
+        abs_time += msg.time
+        if abs_time < start_tick or getattr(msg, 'is_meta', False):
+            continue
+        if properties and hasattr(msg, 'channel'):
+            msg = msg.copy(channel=properties['channel'])
+        events.append((abs_time, 'message', msg))
+    
+    for lyric_time, lyric_text in lyrics:
+        if lyric_time >= start_tick:
+            events.append((lyric_time, 'lyric', lyric_text))
+    
+    downbeat_note, upbeat_note = metronome_notes
+    for beat_tick, beat_ticks, is_downbeat in metronome_grid:
+        if beat_tick >= start_tick:
+            note = downbeat_note if is_downbeat else upbeat_note
+            events.append((beat_tick, 'click', Message('note_on', note=note, velocity=127, channel=9)))
+            events.append((beat_tick + max(1, beat_ticks // 4), 'click', Message('note_off', note=note, velocity=0, channel=9)))
+    
+    events.sort(key=lambda event: event[0])
+    return events
+
+# Channel state messages, the ones a playback plan snapshots when starting mid-track
+STATE_MESSAGE_TYPES = ('control_change', 'program_change', 'pitchwheel', 'aftertouch')
+
+class PlaybackPlan:
+    """The events of one pair on the song clock, built once and shared by every playback of the pair.
+    Lyrics are kept apart so the announcement lead can change without building the plan again."""
+    def __init__(self, events, properties, tempo_map):
+        self.properties = properties
+        self.tempo_map = tempo_map
+        self.events = []  # (seconds, tick, kind, message) of messages and clicks
+        self.lyrics = []  # (seconds, tick, 'lyric', text)
+        for tick, kind, payload in events:
+            event = (tempo_map.tick_to_seconds(tick), tick, kind, payload)
+            (self.lyrics if kind == 'lyric' else self.events).append(event)
+        self.event_ticks = [event[1] for event in self.events]
+        self.lyric_ticks = [event[1] for event in self.lyrics]
         
-    def init_ui(self):
-        panel = wx.Panel(self)
-        vbox = wx.BoxSizer(wx.VERTICAL)
+        # Remapped channel state messages, for the snapshot when starting mid-track
+        self.state_events = [(tick, msg) for _, tick, kind, msg in self.events
+                             if kind == 'message' and msg.type in STATE_MESSAGE_TYPES]
+        self.state_ticks = [tick for tick, _ in self.state_events]
+
+    def start_messages(self, start_tick):
+        """Channel state at start_tick followed by the track property setup"""
+        state = OrderedDict()
+        for _, msg in self.state_events[:bisect.bisect_left(self.state_ticks, start_tick)]:
+            key = (msg.type, msg.channel, msg.control) if msg.type == 'control_change' else (msg.type, msg.channel)
+            state[key] = msg
+        return list(state.values()) + property_setup_messages(self.properties)
+
+    def timeline(self, start_tick, end_tick=None, lyric_lead=0.0):
+        """Get the (seconds, tick, kind, payload) events from start_tick up to end_tick, in time order.
+        Lyrics are moved lyric_lead seconds earlier."""
+        start_seconds = self.tempo_map.tick_to_seconds(start_tick)
+        setup = [(start_seconds, start_tick, 'message', msg) for msg in self.start_messages(start_tick)]
         
-        # Instructions
-        instructions = wx.StaticText(panel, label=lang.get('config_instructions'))
-        vbox.Add(instructions, 0, wx.ALL, 10)
+        first = bisect.bisect_left(self.event_ticks, start_tick)
+        last = len(self.events) if end_tick is None else bisect.bisect_left(self.event_ticks, end_tick)
+        first_lyric = bisect.bisect_left(self.lyric_ticks, start_tick)
+        last_lyric = len(self.lyrics) if end_tick is None else bisect.bisect_left(self.lyric_ticks, end_tick)
+        lyrics = [(seconds - lyric_lead, tick, kind, text) for seconds, tick, kind, text in self.lyrics[first_lyric:last_lyric]]
         
-        # Track pairing area
-        self.pairing_panel = wx.ScrolledWindow(panel)
-        self.pairing_panel.SetScrollRate(5, 5)
-        self.pairing_sizer = wx.BoxSizer(wx.VERTICAL)
-        self.pairing_panel.SetSizer(self.pairing_sizer)
-        vbox.Add(self.pairing_panel, 1, wx.EXPAND | wx.ALL, 5)
+        return list(heapq.merge(setup + self.events[first:last], lyrics, key=lambda event: event[0]))
+
+class SineSynth:
+    """Minimal stand-in synthesizer for WAV export. Any object with the same render
+    method, taking (seconds, message) pairs in time order, can be used instead."""
+    def __init__(self, sample_rate=22050, release=0.05):
+        self.sample_rate = sample_rate
+        self.release = release
+
+    def render(self, timed_messages):
+        """Render the messages to mono 16-bit samples"""
+        end_seconds = timed_messages[-1][0] + 1.0 if timed_messages else 0.0
+        buffer = [0.0] * int(end_seconds * self.sample_rate)
+        sounding = {}  # (channel, note) -> (start seconds, velocity)
         
-        # Buttons
-        btn_box = wx.BoxSizer(wx.HORIZONTAL)
-        add_btn = wx.Button(panel, label=lang.get('add_pair'))
-        add_btn.Bind(wx.EVT_BUTTON, self.on_add_pair)
-        btn_box.Add(add_btn, 0, wx.ALL, 5)
+        for seconds, msg in timed_messages:
+            if msg.type == 'note_on' and msg.velocity > 0:
+                sounding[(msg.channel, msg.note)] = (seconds, msg.velocity)
+            elif msg.type in ['note_on', 'note_off']:
+                started = sounding.pop((msg.channel, msg.note), None)
+                if started:
+                    self.mix_note(buffer, msg.channel, msg.note, started[1], started[0], seconds)
+            elif msg.type == 'control_change' and msg.control == 123:
+                for channel, note in [key for key in sounding if key[0] == msg.channel]:
+                    started = sounding.pop((channel, note))
+                    self.mix_note(buffer, channel, note, started[1], started[0], seconds)
         
-        btn_box.Add(wx.Button(panel, wx.ID_OK, lang.get('ok')), 0, wx.ALL, 5)
-        btn_box.Add(wx.Button(panel, wx.ID_CANCEL, lang.get('cancel')), 0, wx.ALL, 5)
-        vbox.Add(btn_box, 0, wx.ALIGN_CENTER | wx.ALL, 10)
+        for (channel, note), (started, velocity) in sounding.items():
+            self.mix_note(buffer, channel, note, velocity, started, end_seconds)
         
-        panel.SetSizer(vbox)
+        # Normalize to the 16-bit range
+        peak = max((abs(sample) for sample in buffer), default=0.0)
+        scale = 32000.0 / peak if peak > 1.0 else 32000.0
+        return array('h', (int(sample * scale) for sample in buffer))
+
+    def mix_note(self, buffer, channel, note, velocity, start, end):
+        if channel == 9:
+            # Percussion, a short high click
+            frequency = 1500.0 if note % 2 == 0 else 1000.0
+            end = start + 0.03
+        else:
+            frequency = 440.0 * 2 ** ((note - 69) / 12.0)
         
-        # Initialize with suggested pairing
-        self.auto_suggest_pairs()
+        amplitude = 0.3 * velocity / 127.0
+        step = 2 * math.pi * frequency / self.sample_rate
+        first = int(start * self.sample_rate)
+        release_start = int(end * self.sample_rate)
+        last = min(len(buffer), int((end + self.release) * self.sample_rate))
+        attack = max(1, int(0.005 * self.sample_rate))
+        release = max(1, last - release_start)
         
-    def auto_suggest_pairs(self):
-        # Clear existing pairs
-        self.pairing_sizer.Clear(True)
-        self.track_pairs.clear()
+        for i in range(first, last):
+            t = i - first
+            envelope = min(1.0, t / attack)
+            if i >= release_start:
+                envelope *= 1.0 - (i - release_start) / release
+            buffer[i] += amplitude * envelope * math.sin(step * t)
+
+# Meta events carrying text that can hold lyrics
+TEXT_META_TYPES = ['lyrics', 'text', 'marker', 'cue_marker', 'copyright']
+
+# Candidate encodings for MIDI text, tried in this order
+TEXT_ENCODINGS = ['utf-8', 'cp932', 'cp1252', 'latin-1']
+
+def raw_text_bytes(text):
+    """Recover the raw bytes of a text mido decoded, mido decodes meta text as Latin-1"""
+    try:
+        return text.encode('latin-1')
+    except UnicodeEncodeError:
+        return text.encode('utf-8')
+
+# Text meta events by type byte, the only events the chunk scanner reads
+TEXT_META_BYTES = {0x01: 'text', 0x02: 'copyright', 0x03: 'track_name', 0x05: 'lyrics', 0x06: 'marker', 0x07: 'cue_marker'}
+
+# Data bytes after the status byte of system common messages
+SYSTEM_COMMON_LENGTHS = {0xF1: 1, 0xF2: 2, 0xF3: 1}
+
+def read_variable_length(data, pos):
+    value = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value = (value << 7) | (byte & 0x7F)
+        if byte < 0x80:
+            return value, pos
+
+def scan_track_chunks(raw):
+    """Scan the track chunks of a Standard MIDI File for text meta events without decoding
+    anything else, channel and sysex events are skipped by their status byte and length.
+    Returns (note channels, [(tick, type, raw text)]) for every track, or None if the file
+    can not be scanned."""
+    if raw[:4] != b'MThd':
+        return None
+    pos = 8 + int.from_bytes(raw[4:8], 'big')
+    tracks = []
+    try:
+        while pos + 8 <= len(raw):
+            chunk_type = raw[pos:pos + 4]
+            end = pos + 8 + int.from_bytes(raw[pos + 4:pos + 8], 'big')
+            if chunk_type == b'MTrk':
+                tracks.append(scan_track_chunk(raw, pos + 8, min(end, len(raw))))
+            pos = end
+    except IndexError:
+        return None
+    return tracks
+
+def scan_track_chunk(data, pos, end):
+    tick = 0
+    status = 0
+    note_channels = set()
+    texts = []
+    
+    while pos < end:
+        delta, pos = read_variable_length(data, pos)
+        tick += delta
+        byte = data[pos]
         
-        # Suggest pairs based on track content
-        notes_indices = [i for i, (_, has_notes, _) in enumerate(self.track_info) if has_notes]
-        lyrics_indices = [i for i, (_, _, has_lyrics) in enumerate(self.track_info) if has_lyrics]
-        
-        # Strategy 1: Same track has both notes and lyrics
-        same_track_pairs = []
-        for i, (name, has_notes, has_lyrics) in enumerate(self.track_info):
-            if has_notes and has_lyrics:
-                same_track_pairs.append((i, i))
-        
-        if same_track_pairs:
-            # Use same-track pairs
-            for notes_track, lyrics_track in same_track_pairs:
-                notes_selection = self.get_notes_track_index(notes_track)
-                lyrics_selection = self.get_lyrics_track_index(lyrics_track)
-                self.add_track_pair(notes_selection, lyrics_selection)
+        if byte == 0xFF:
+            meta_type = data[pos + 1]
+            length, pos = read_variable_length(data, pos + 2)
+            if meta_type in TEXT_META_BYTES:
+                texts.append((tick, TEXT_META_BYTES[meta_type], bytes(data[pos:pos + length])))
+            elif meta_type == 0x2F:
+                break  # End of track
+            pos += length
+        elif byte in (0xF0, 0xF7):
+            length, pos = read_variable_length(data, pos + 1)
+            pos += length
+        elif byte > 0xF0:
+            pos += 1 + SYSTEM_COMMON_LENGTHS.get(byte, 0)
         else:
-            # Strategy 2: Separate tracks - try alternating pattern
-            for i, notes_track_idx in enumerate(notes_indices):
-                lyrics_track_idx = None
-                # Try to find a lyrics track after this notes track
-                for lyrics_idx in lyrics_indices:
-                    if lyrics_idx > notes_track_idx:
-                        lyrics_track_idx = lyrics_idx
-                        break
-                
-                notes_selection = self.get_notes_track_index(notes_track_idx)
-                if lyrics_track_idx is not None:
-                    lyrics_selection = self.get_lyrics_track_index(lyrics_track_idx)
-                else:
-                    lyrics_selection = len(self.lyrics_tracks) - 1  # "No lyrics"
-                
-                self.add_track_pair(notes_selection, lyrics_selection)
-        
-        # If no pairs were suggested, add at least one empty pair
-        if not self.track_pairs:
-            self.add_track_pair()
-        
-        self.pairing_panel.FitInside()
+            # Channel message, the status byte may be left out (running status)
+            if byte & 0x80:
+                status = byte
+                pos += 1
+            if status & 0xF0 in (0xC0, 0xD0):
+                pos += 1
+            else:
+                if status & 0xF0 == 0x90 and data[pos + 1] > 0:
+                    note_channels.add(status & 0x0F)
+                pos += 2
     
-    def get_notes_track_index(self, track_idx):
-        """Get the index in the filtered notes_tracks list"""
-        for i, (idx, _) in enumerate(self.notes_tracks):
-            if idx == track_idx:
-                return i
-        return 0
+    return tuple(sorted(note_channels)), texts
+
+def detect_text_encoding(samples):
+    """Choose the encoding that decodes all raw text samples of a track"""
+    raw = b'\n'.join(samples)
+    if not any(byte > 0x7F for byte in raw):
+        return 'latin-1'  # Plain ASCII, any encoding gives the same text
     
-    def get_lyrics_track_index(self, track_idx):
-        """Get the index in the filtered lyrics_tracks list"""
-        if track_idx is None:
-            return len(self.lyrics_tracks) - 1  # "No lyrics" option
-        for i, (idx, _) in enumerate(self.lyrics_tracks):
-            if idx == track_idx:
-                return i
-        return len(self.lyrics_tracks) - 1  # Default to "No lyrics"
+    for encoding in TEXT_ENCODINGS:
+        try:
+            decoded = raw.decode(encoding)
+        except UnicodeDecodeError:
+            continue
+        if encoding == 'cp932':
+            # Latin text often decodes as Shift-JIS too, require mostly Japanese characters
+            non_ascii = [c for c in decoded if ord(c) > 0x7F]
+            japanese = [c for c in non_ascii if '\u3000' <= c <= '\u9fff' or '\uff00' <= c <= '\uffef']
+            if len(japanese) * 2 < len(non_ascii):
+                continue
+        return encoding
+    return 'latin-1'
+
+# Approximate memory of a parsed mido message and of an onset group, for memory budgets
+PARSED_MESSAGE_BYTES = 200
+NOTE_GROUP_BYTES = 250
+
+def read_midi_analysis(raw):
+    """Analyze the bytes of a MIDI file. Track names and contents come from a scan of the raw
+    chunks, the file is only parsed when its messages are needed."""
+    analysis = MidiAnalysis(None, raw)
+    if analysis.track_scans is None:
+        analysis.get_midi_data()
+    return analysis
+
+class MidiAnalysis:
+    """Analysis of a loaded MIDI file, with extraction results memoized per source track"""
+    def __init__(self, midi_data, raw=None):
+        self.raw = raw
+        self.parsed_midi_data = midi_data
+        self.parse_lock = threading.Lock()
+        # (note channels, raw text events) of every track from the raw chunks
+        self.track_scans = scan_track_chunks(raw) if raw is not None else None
+        self.track_summaries = None
+        self.channel_voices = None  # (track, channel) of the voices of multi-channel tracks
+        self.voice_tracks = {}  # Voice source index -> MidiTrack of its channel
+        self.track_notes = {}
+        self.track_lyrics = {}  # Track index -> LyricModel
+        self.track_texts = {}  # Track index -> (encoding, [(tick, type, text)])
+        self.tempo_info = None
+
+    @property
+    def midi_data(self):
+        return self.get_midi_data()
+
+    def get_midi_data(self):
+        """Get the parsed file, parsing the raw bytes on first use"""
+        with self.parse_lock:
+            if self.parsed_midi_data is None:
+                self.parsed_midi_data = MidiFile(file=io.BytesIO(self.raw))
+                # Files the scan reads differently from the parser are analyzed from the messages
+                if self.track_scans is not None and len(self.track_scans) != len(self.parsed_midi_data.tracks):
+                    self.track_scans = None
+                    self.track_summaries = None
+                    self.track_texts = {}
+            return self.parsed_midi_data
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['parse_lock']
+        # Results are memoized lazily by other threads, the copy keeps the ones found so far
+        for key in ('track_notes', 'track_lyrics', 'voice_tracks', 'track_texts'):
+            state[key] = dict(state[key])
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.parse_lock = threading.Lock()
+        # Analyses saved before channels were scanned only know whether a track has notes
+        if self.track_scans and not isinstance(self.track_scans[0][0], tuple):
+            self.track_scans = None
+        self.__dict__.setdefault('channel_voices', None)
+        self.__dict__.setdefault('voice_tracks', {})
+
+    def estimate_size(self):
+        """Rough memory use in bytes, dominated by the parsed messages"""
+        size = len(self.raw) if self.raw is not None else 0
+        if self.parsed_midi_data is not None:
+            size += sum(len(track) for track in self.parsed_midi_data.tracks) * PARSED_MESSAGE_BYTES
+        # Other threads may be memoizing notes, the values are listed at once
+        size += sum(len(notes) for notes in list(self.track_notes.values())) * NOTE_GROUP_BYTES
+        return size
+
+    def release(self):
+        """Drop the parsed messages and notes, keeping the raw bytes and scan to parse them again"""
+        if self.raw is None:
+            return
+        with self.parse_lock:
+            self.parsed_midi_data = None
+        self.track_notes = {}
+        self.voice_tracks = {}
+
+    def get_ticks_per_beat(self):
+        """Get the resolution of the file, from the header without parsing the messages"""
+        if self.parsed_midi_data is None and self.raw is not None and self.raw[:4] == b'MThd' and len(self.raw) >= 14:
+            return int.from_bytes(self.raw[12:14], 'big', signed=True)
+        return self.midi_data.ticks_per_beat
+
+    def get_track_count(self):
+        if self.track_scans is not None:
+            return len(self.track_scans)
+        return len(self.midi_data.tracks)
+
+    def get_source_count(self):
+        """Number of pairable sources, the tracks followed by the channel voices"""
+        return self.get_track_count() + len(self.get_channel_voices())
+
+    def get_track_channels(self, track_idx):
+        """Get the channels a track plays notes on, in order"""
+        if self.track_scans is not None:
+            return self.track_scans[track_idx][0]
+        return tuple(sorted({msg.channel for msg in self.midi_data.tracks[track_idx] if msg.type == 'note_on' and msg.velocity > 0}))
+
+    def get_channel_voices(self):
+        """Get (track, channel) of every channel of the tracks playing notes on several channels.
+        Voice i is the source get_track_count() + i, so pairs refer to voices like to tracks."""
+        if self.channel_voices is None:
+            self.channel_voices = []
+            for i in range(self.get_track_count()):
+                channels = self.get_track_channels(i)
+                if len(channels) > 1:
+                    self.channel_voices.extend((i, channel) for channel in channels)
+        return self.channel_voices
+
+    def get_voice(self, source_idx):
+        """Get (track, channel) of a voice source, or None for a track"""
+        voice_idx = source_idx - self.get_track_count()
+        voices = self.get_channel_voices()
+        return voices[voice_idx] if 0 <= voice_idx < len(voices) else None
+
+    def get_source_number(self, source_idx):
+        """Get the 1-based track number of a source for display, with the channel for a voice"""
+        voice = self.get_voice(source_idx)
+        if voice is None:
+            return f"{source_idx + 1}"
+        return f"{voice[0] + 1}, {lang.get('channel_word')} {voice[1] + 1}"
+
+    def get_source_track(self, source_idx):
+        """Get the track a source is read from, a voice is read from the track it belongs to"""
+        voice = self.get_voice(source_idx)
+        return voice[0] if voice else source_idx
+
+    def get_voice_info(self):
+        """Get (source index, track, name) of every channel voice"""
+        track_info = self.get_track_info()
+        return [(self.get_track_count() + i, track_idx, f"{track_info[track_idx][0]}, {lang.get('channel_word')} {channel + 1}")
+                for i, (track_idx, channel) in enumerate(self.get_channel_voices())]
+
+    def get_track(self, source_idx):
+        """Get the messages of a source for playback. A voice gets the messages of its channel and
+        the meta messages of its track, with the delta times of the other channels carried over."""
+        voice = self.get_voice(source_idx)
+        if voice is None:
+            return self.midi_data.tracks[source_idx]
+        if source_idx not in self.voice_tracks:
+            track_idx, channel = voice
+            voice_track = MidiTrack()
+            carried = 0
+            for msg in self.midi_data.tracks[track_idx]:
+                if hasattr(msg, 'channel') and msg.channel != channel:
+                    carried += msg.time
+                    continue
+                voice_track.append(msg.copy(time=msg.time + carried))
+                carried = 0
+            self.voice_tracks[source_idx] = voice_track
+        return self.voice_tracks[source_idx]
+
+    def get_track_info(self):
+        """Get (name, has_notes, has_lyrics) for every track, analyzing each track only once"""
+        if self.track_summaries is None:
+            self.track_summaries = []
+            for i in range(self.get_track_count()):
+                track_name = None
+                for _, msg_type, text in self.get_track_text(i)[1]:
+                    if msg_type == 'track_name':
+                        track_name = text.strip()
+                        break
+                has_notes, has_lyrics = self.analyze_track_content(i)
+                self.track_summaries.append((track_name, has_notes, has_lyrics))
+
+        # Names are built on every call so they follow the current language
+        track_info = []
+        for i, (track_name, has_notes, has_lyrics) in enumerate(self.track_summaries):
+            name = f"{lang.get('track')} {i + 1}"
+            if track_name is not None:
+                name = f"{name}: {track_name}"
+            track_info.append((name, has_notes, has_lyrics))
+        return track_info
+
+    def get_notes(self, track_idx):
+        """Get the notes of a source track, extracting them on first use.
+        The notes of a voice are taken from the notes of its track, without reading the track again."""
+        if track_idx is None or track_idx >= self.get_source_count():
+            return []
+        if track_idx not in self.track_notes:
+            voice = self.get_voice(track_idx)
+            if voice is None:
+                self.track_notes[track_idx] = self.extract_notes_from_track(self.midi_data.tracks[track_idx])
+            else:
+                parent_idx, channel = voice
+                voice_notes = []
+                for tick, chord in self.get_notes(parent_idx):
+                    voice_chord = tuple(note for note in chord if note[1] == channel)
+                    if voice_chord:
+                        voice_notes.append((tick, voice_chord))
+                self.track_notes[track_idx] = voice_notes
+        return self.track_notes[track_idx]
+
+    def get_lyrics(self, track_idx):
+        """Get the timed syllables of a source track"""
+        return self.get_lyric_model(track_idx).syllables
+
+    def get_lyric_model(self, track_idx):
+        """Get the words, lines and paragraphs of a source track, parsing them on first use.
+        Text events have no channel, a voice has the lyrics of its track."""
+        if track_idx is None or track_idx >= self.get_source_count():
+            return LyricModel([])
+        track_idx = self.get_source_track(track_idx)
+        if track_idx not in self.track_lyrics:
+            self.track_lyrics[track_idx] = LyricModel(self.extract_lyrics_from_track(track_idx))
+        return self.track_lyrics[track_idx]
+
+    def get_track_text(self, track_idx):
+        """Get (encoding, [(tick, type, text)]) for the text events of a track, decoded in one batch"""
+        if track_idx not in self.track_texts:
+            self.track_texts[track_idx] = self.decode_track_text(self.get_raw_text_events(track_idx))
+        return self.track_texts[track_idx]
+
+    def get_text_encoding(self, track_idx):
+        if track_idx is None or track_idx >= self.get_source_count():
+            return 'latin-1'
+        return self.get_track_text(self.get_source_track(track_idx))[0]
+
+    def get_raw_text_events(self, track_idx):
+        """Get (tick, type, raw bytes) of the text events of a track, from the chunk scan when there is one"""
+        if self.track_scans is not None:
+            return self.track_scans[track_idx][1]
         
-    def add_track_pair(self, notes_track=0, lyrics_track=0):
-        pair_panel = wx.Panel(self.pairing_panel)
-        pair_sizer = wx.BoxSizer(wx.HORIZONTAL)
+        raw_events = []
+        abs_time = 0
+        for msg in self.midi_data.tracks[track_idx]:
+            abs_time += msg.time
+            if msg.type == 'track_name':
+                raw_events.append((abs_time, msg.type, raw_text_bytes(msg.name or "")))
+            elif msg.type in TEXT_META_TYPES:
+                raw_events.append((abs_time, msg.type, raw_text_bytes(msg.text or "")))
+        return raw_events
+
+    def decode_track_text(self, raw_events):
+        # The raw bytes of every text event are gathered first, so the encoding is chosen once per track
+        encoding = detect_text_encoding([raw for _, _, raw in raw_events])
+        texts = [(tick, msg_type, raw.decode(encoding, errors='replace')) for tick, msg_type, raw in raw_events]
+        return encoding, texts
+
+    def get_time_signature_and_tempo(self):
+        """Extract time signature and tempo changes from MIDI file, scanning it only once"""
+        if self.tempo_info is not None:
+            return self.tempo_info
         
-        # Notes track selection (filtered to only tracks with notes)
-        pair_sizer.Add(wx.StaticText(pair_panel, label=lang.get('notes')), 0, wx.ALIGN_CENTER_VERTICAL | wx.ALL, 5)
-        notes_choices = [name for _, name in self.notes_tracks]
-        notes_choice = wx.Choice(pair_panel, choices=notes_choices)
-        if notes_choices:  # Only set selection if there are choices
-            notes_choice.SetSelection(min(notes_track, len(notes_choices) - 1))
-        pair_sizer.Add(notes_choice, 1, wx.ALL, 5)
+        time_signatures = []
+        tempo_changes = []
         
-        # Lyrics track selection (filtered to only tracks with lyrics + "No lyrics")
+        for track in self.midi_data.tracks:
+            accumulated_time = 0
+            for msg in track:
+                accumulated_time += msg.time
+                
+                if msg.type == 'time_signature':
+                    # MIDI time signature: numerator/denominator, clocks_per_click, notated_32nd_notes_per_beat
+                    time_signatures.append((accumulated_time, msg.numerator, msg.denominator))
+                
+                elif msg.type == 'set_tempo':
+                    # Convert microseconds per beat to BPM
+                    bpm = 60000000 / msg.tempo
+                    tempo_changes.append((accumulated_time, bpm))
+        
+        # Changes come from several tracks, keep them in time order
+        time_signatures.sort(key=lambda sig: sig[0])
+        tempo_changes.sort(key=lambda change: change[0])
+        
+        # Set defaults if not found
+        if not time_signatures:
+            time_signatures = [(0, 4, 4)]  # Default 4/4 time
+        if not tempo_changes:
+            tempo_changes = [(0, 120)]  # Default 120 BPM
+        
+        self.tempo_info = (time_signatures, tempo_changes)
+        return self.tempo_info
+
+    def analyze_track_content(self, track_idx):
+        # Only text meta events count as lyrics, sysex and other data never do
+        has_lyrics = any(text.strip() for _, msg_type, text in self.get_track_text(track_idx)[1] if msg_type != 'track_name')
+        
+        if self.track_scans is not None:
+            has_notes = bool(self.track_scans[track_idx][0])
+        else:
+            has_notes = any(msg.type == 'note_on' and msg.velocity > 0 for msg in self.midi_data.tracks[track_idx])
+        
+        return has_notes, has_lyrics
+
+    def extract_notes_from_track(self, track):
+        """Get the onset groups of a track as (tick, chord), chord holding the (note, channel,
+        duration, velocity) of every note starting at that tick. Note ons are paired with their
+        note offs, including note ons with velocity 0, in one pass."""
+        abs_time = 0
+        track_notes = []  # [tick, note, channel, duration, velocity], duration set by the note off
+        open_notes = {}  # (channel, note) -> indices in track_notes still sounding, oldest first
+        
+        for msg in track:
+            abs_time += msg.time
+            if msg.type == 'note_on' and msg.velocity > 0:
+                channel = getattr(msg, 'channel', 0)
+                open_notes.setdefault((channel, msg.note), deque()).append(len(track_notes))
+                track_notes.append([abs_time, msg.note, channel, None, msg.velocity])
+            elif msg.type in ('note_on', 'note_off'):
+                sounding = open_notes.get((getattr(msg, 'channel', 0), msg.note))
+                if sounding:
+                    started = track_notes[sounding.popleft()]
+                    started[3] = abs_time - started[0]
+        
+        onset_groups = []
+        for tick, note, channel, duration, velocity in track_notes:
+            # Notes never released last until the end of the track
+            if duration is None:
+                duration = abs_time - tick
+            if onset_groups and onset_groups[-1][0] == tick:
+                onset_groups[-1][1].append((note, channel, duration, velocity))
+            else:
+                onset_groups.append((tick, [(note, channel, duration, velocity)]))
+        
+        return [(tick, tuple(chord)) for tick, chord in onset_groups]
+
+    def extract_lyrics_from_track(self, track_idx):
+        """Get the raw (tick, text) lyric events of a track, markers and spacing are kept for LyricModel"""
+        track_lyrics = []
+        
+        # Text events, already decoded with the encoding of the track
+        for abs_time, msg_type, text in self.get_track_text(track_idx)[1]:
+            if msg_type != 'track_name' and text.strip():
+                track_lyrics.append((abs_time, text))
+        
+        track_lyrics.sort(key=lambda lyric: lyric[0])
+        return track_lyrics
+
+# Rows of lyrics kept in the lyric display, and how close the current row may get to
+# an edge of them before the window is moved
+LYRIC_WINDOW_ROWS = 15
+LYRIC_WINDOW_MARGIN = 3
+
+class LyricModel:
+    """Syllables, words, lines and paragraphs of a lyric track, parsed once from the KAR
+    and RP-017 conventions: '@' headers, '\\' new paragraph, '/' or CR/LF new line,
+    spaces between words and a trailing '-' joining a syllable to the next one"""
+    def __init__(self, raw_lyrics):
+        self.headers = {}  # KAR header letter -> values, such as 'T' for the title
+        self.syllables = []  # (tick, text)
+        self.words = []  # [first syllable, end syllable, line]
+        self.lines = []  # [first word, end word, paragraph]
+        self.parse(raw_lyrics)
+        self.render()
+
+    def parse(self, raw_lyrics):
+        # Files that never space their syllables separate words with events instead
+        spaced = any(raw.strip('\r\n')[:1] == ' ' or raw.strip('\r\n')[-1:] == ' ' for _, raw in raw_lyrics)
+        
+        paragraph = -1
+        paragraph_break = True
+        line_break = True
+        word_break = True
+        continues = False
+        
+        for tick, raw in raw_lyrics:
+            if raw.startswith('@'):
+                self.headers.setdefault(raw[1:2], []).append(raw[2:].strip())
+                continue
+            
+            text = raw
+            if text.startswith('\\'):
+                paragraph_break = True
+                text = text[1:]
+            elif text.startswith('/'):
+                line_break = True
+                text = text[1:]
+            if text[:1] in ('\r', '\n') and text[:1]:
+                line_break = True
+                text = text.lstrip('\r\n')
+            ends_line = text[-1:] in ('\r', '\n') and text[-1:] != ''
+            text = text.rstrip('\r\n')
+            if text.startswith(' '):
+                word_break = True
+            
+            core = text.strip()
+            if core == '-':
+                continues = True
+                continue
+            if core:
+                if paragraph_break:
+                    paragraph += 1
+                    line_break = True
+                if line_break:
+                    self.lines.append([len(self.words), len(self.words), paragraph])
+                if line_break or (not continues and (word_break or not spaced)):
+                    self.words.append([len(self.syllables), len(self.syllables), len(self.lines) - 1])
+                    self.lines[-1][1] += 1
+                self.syllables.append((tick, core))
+                self.words[-1][1] += 1
+                
+                paragraph_break = False
+                line_break = False
+                word_break = False
+                continues = core.endswith('-')
+            
+            if text.endswith(' '):
+                word_break = True
+            if ends_line:
+                line_break = True
+
+    def render(self):
+        """Lay the lyrics out one line per row, with a blank row between paragraphs"""
+        rows = []
+        self.line_rows = []  # Row of each line
+        self.syllable_positions = []  # (row, start column, end column) of each syllable
+        self.syllable_lines = []  # Line of each syllable
+        previous_paragraph = None
+        for first_word, end_word, paragraph in self.lines:
+            if previous_paragraph is not None and paragraph != previous_paragraph:
+                rows.append('')
+            previous_paragraph = paragraph
+            
+            row = len(rows)
+            self.line_rows.append(row)
+            parts = []
+            column = 0
+            for word in range(first_word, end_word):
+                if word > first_word:
+                    parts.append(' ')
+                    column += 1
+                first_syllable, end_syllable, _ = self.words[word]
+                for _, text in self.syllables[first_syllable:end_syllable]:
+                    self.syllable_positions.append((row, column, column + len(text)))
+                    self.syllable_lines.append(len(self.line_rows) - 1)
+                    parts.append(text)
+                    column += len(text)
+            rows.append(''.join(parts))
+        
+        self.rows = rows
+        self.text = '\n'.join(rows)
+        self.syllable_ticks = [tick for tick, _ in self.syllables]
+
+    def window_around(self, syllable, size):
+        """First and end row of a window of about size rows centered on the line of a syllable"""
+        row = self.syllable_positions[syllable][0]
+        first_row = max(0, min(row - size // 2, len(self.rows) - size))
+        return first_row, min(len(self.rows), first_row + size)
+
+    def word_text(self, word):
+        first_syllable, end_syllable, _ = self.words[word]
+        return ''.join(text for _, text in self.syllables[first_syllable:end_syllable])
+
+    def syllable_at(self, tick):
+        """Index of the last syllable at or before tick, -1 if there is none"""
+        return bisect.bisect_right(self.syllable_ticks, tick) - 1
+
+    def get_title(self):
+        titles = self.headers.get('T')
+        return titles[0] if titles else None
+
+class BarIndex:
+    """Bar and beat positions of a pair, built from the time signatures of the file"""
+    def __init__(self, time_signatures, ticks_per_beat, note_ticks):
+        self.note_ticks = note_ticks
+        self.bar_starts = []
+        self.bar_beat_ticks = []
+        end_tick = note_ticks[-1] + 1 if note_ticks else 1
+        for tick, beat_ticks, is_downbeat in build_metronome_grid(time_signatures, ticks_per_beat, end_tick):
+            if is_downbeat:
+                self.bar_starts.append(tick)
+                self.bar_beat_ticks.append(beat_ticks)
+
+    def bar_count(self):
+        return len(self.bar_starts)
+
+    def bar_at(self, tick):
+        """Get the 0-based bar containing a tick"""
+        return max(0, bisect.bisect_right(self.bar_starts, tick) - 1)
+
+    def bar_beat(self, note_index):
+        """Get the 1-based (bar, beat) of a note"""
+        if not self.note_ticks or not self.bar_starts:
+            return 1, 1
+        tick = self.note_ticks[note_index]
+        bar = self.bar_at(tick)
+        beat = (tick - self.bar_starts[bar]) // self.bar_beat_ticks[bar]
+        return bar + 1, beat + 1
+
+    def first_note_in_bar(self, bar):
+        """Get the index of the first note at or after the start of a 0-based bar"""
+        bar = max(0, min(bar, len(self.bar_starts) - 1))
+        if not self.bar_starts:
+            return 0
+        return min(bisect.bisect_left(self.note_ticks, self.bar_starts[bar]), max(0, len(self.note_ticks) - 1))
+
+    def move_by_bars(self, note_index, bars):
+        """Get the first note of the bar bars away. Going back, empty bars such as rests are
+        skipped to the nearest bar with notes, so a backward move always leaves the current note."""
+        if not self.note_ticks:
+            return 0
+        bar = self.bar_at(self.note_ticks[note_index]) + bars
+        if bars >= 0:
+            return self.first_note_in_bar(bar)
+        
+        # The last note before the end of the target bar, and before the current note
+        bar = max(bar, 0)
+        end_tick = self.bar_starts[bar + 1] if bar + 1 < len(self.bar_starts) else self.note_ticks[-1] + 1
+        last = min(bisect.bisect_left(self.note_ticks, end_tick), note_index) - 1
+        if last < 0:
+            return 0
+        return self.first_note_in_bar(self.bar_at(self.note_ticks[last]))
+
+def normalize_lyric(text):
+    """Fold accents, case and punctuation away so searches ignore them"""
+    decomposed = unicodedata.normalize('NFKD', text)
+    return ''.join(c for c in decomposed if c.isalnum()).casefold()
+
+class LyricSearchIndex:
+    """Word index over the lyrics of all pairs, mapped back to note indices"""
+    def __init__(self, notes, lyric_models):
+        self.words = []  # (normalized word, pair index, note index of its first syllable)
+        self.ngrams = {}  # Substring of up to 3 characters -> ids of the words containing it
+        
+        for pair_index, (pair_notes, model) in enumerate(zip(notes, lyric_models)):
+            note_ticks = [note[0] for note in pair_notes]
+            for word, (first_syllable, _, _) in enumerate(model.words):
+                normalized = normalize_lyric(model.word_text(word))
+                if normalized:
+                    word_tick = model.syllables[first_syllable][0]
+                    self.add_word(normalized, pair_index, self.note_index_at(note_ticks, word_tick))
+
+    def note_index_at(self, note_ticks, tick):
+        """First note at or after a lyric"""
+        return min(bisect.bisect_left(note_ticks, tick), max(0, len(note_ticks) - 1))
+
+    def add_word(self, word, pair_index, note_index):
+        word_id = len(self.words)
+        self.words.append((word, pair_index, note_index))
+        for size in range(1, 4):
+            for i in range(len(word) - size + 1):
+                self.ngrams.setdefault(word[i:i + size], set()).add(word_id)
+
+    def candidates(self, query_word):
+        """Ids of the words that can contain query_word"""
+        if len(query_word) <= 3:
+            return sorted(self.ngrams.get(query_word, ()))
+        postings = [self.ngrams.get(query_word[i:i + 3], set()) for i in range(len(query_word) - 2)]
+        return sorted(set.intersection(*sorted(postings, key=len)))
+
+    def search(self, query):
+        """Get (pair index, note index) of every match in lyric order, consecutive query
+        words have to be found in consecutive words of the same pair"""
+        query_words = [normalize_lyric(part) for part in query.split()]
+        query_words = [word for word in query_words if word]
+        if not query_words:
+            return []
+        
+        matches = []
+        for word_id in self.candidates(query_words[0]):
+            if word_id + len(query_words) > len(self.words):
+                continue
+            _, pair_index, note_index = self.words[word_id]
+            for offset, query_word in enumerate(query_words):
+                word, word_pair, _ = self.words[word_id + offset]
+                if word_pair != pair_index or query_word not in word:
+                    break
+            else:
+                matches.append((pair_index, note_index))
+        return matches
+
+def suggest_track_pairs(track_info):
+    """Suggest (notes track, lyrics track or None) pairs from (name, has_notes, has_lyrics) track info"""
+    notes_indices = [i for i, (_, has_notes, _) in enumerate(track_info) if has_notes]
+    lyrics_indices = [i for i, (_, _, has_lyrics) in enumerate(track_info) if has_lyrics]
+    
+    # Strategy 1: Same track has both notes and lyrics
+    same_track_pairs = [(i, i) for i, (_, has_notes, has_lyrics) in enumerate(track_info) if has_notes and has_lyrics]
+    if same_track_pairs:
+        return same_track_pairs
+    
+    # Strategy 2: Separate tracks - try alternating pattern
+    pairs = []
+    for notes_track_idx in notes_indices:
+        lyrics_track_idx = None
+        # Try to find a lyrics track after this notes track
+        for lyrics_idx in lyrics_indices:
+            if lyrics_idx > notes_track_idx:
+                lyrics_track_idx = lyrics_idx
+                break
+        pairs.append((notes_track_idx, lyrics_track_idx))
+    return pairs
+
+def split_track_pairs(pairs, voice_info):
+    """Replace the notes track of every pair by its channel voices, each one paired with the
+    same lyrics. voice_info holds (source index, track, name) as from get_voice_info"""
+    voices = {}
+    for source_idx, track_idx, _ in voice_info:
+        voices.setdefault(track_idx, []).append(source_idx)
+    return [(voice, lyrics_track) for notes_track, lyrics_track in pairs for voice in voices.get(notes_track, [notes_track])]
+
+def build_alignment_report(notes, lyrics, tolerance):
+    """Summarize how the lyrics of a pair line up with its notes, listing the
+    syllables that have no note onset within tolerance ticks"""
+    note_ticks = [note[0] for note in notes]
+    unaligned = []
+    for lyric_time, lyric_text in lyrics:
+        i = bisect.bisect_left(note_ticks, lyric_time)
+        distances = [abs(note_ticks[j] - lyric_time) for j in (i - 1, i) if 0 <= j < len(note_ticks)]
+        if not distances or min(distances) > tolerance:
+            unaligned.append({'tick': lyric_time, 'text': lyric_text})
+    return {'notes': len(notes), 'lyrics': len(lyrics), 'unaligned_lyrics': unaligned}
+
+class LintStep:
+    """A note group of a pair with the syllables attached to it, as handed to the lint rules.
+    Offsets are the ticks from the onset of the note to each syllable"""
+    def __init__(self, note_index, tick, chord, syllables, is_first, is_last, rest_before, has_lyrics, tolerance):
+        self.note_index = note_index
+        self.tick = tick
+        self.chord = chord
+        self.length = max(note[2] for note in chord)
+        self.syllables = syllables  # (offset, text)
+        self.is_first = is_first
+        self.is_last = is_last
+        self.rest_before = rest_before
+        self.has_lyrics = has_lyrics
+        self.tolerance = tolerance
+
+    def in_range(self, offset):
+        """Whether a syllable lies within the notes of the pair"""
+        if offset < -self.tolerance:
+            return not self.is_first
+        return not (self.is_last and offset > max(self.length, self.tolerance))
+
+class LintRule:
+    """A check of lint_pair, yields (tick, text) findings for a step"""
+    name = ''
+
+    def check(self, step):
+        return ()
+
+class SyllableWithoutNoteRule(LintRule):
+    """Syllables sung during a rest"""
+    name = 'no_note'
+
+    def check(self, step):
+        for offset, text in step.syllables:
+            if step.in_range(offset) and offset > step.tolerance and offset >= step.length:
+                yield step.tick + offset, text
+
+class NoteWithoutSyllableRule(LintRule):
+    """Notes after a rest with no syllable. Notes tied to the one before, as in a melisma, need none"""
+    name = 'no_syllable'
+
+    def check(self, step):
+        if step.has_lyrics and step.rest_before and not step.syllables:
+            yield step.tick, ''
+
+class OutOfRangeRule(LintRule):
+    """Syllables before the first note or after the last one"""
+    name = 'out_of_range'
+
+    def check(self, step):
+        for offset, text in step.syllables:
+            if not step.in_range(offset):
+                yield step.tick + offset, text
+
+class DoubledSyllableRule(LintRule):
+    """More than one syllable on the same note"""
+    name = 'doubled'
+
+    def check(self, step):
+        sung = [(offset, text) for offset, text in step.syllables
+                if step.in_range(offset) and (offset <= step.tolerance or offset < step.length)]
+        for offset, text in sung[1:]:
+            yield step.tick + offset, text
+
+class LateLyricRule(LintRule):
+    """Syllables that come after the onset of their note by more than the tolerance"""
+    name = 'late'
+
+    def check(self, step):
+        for offset, text in step.syllables:
+            if step.in_range(offset) and step.tolerance < offset < step.length:
+                yield step.tick + offset, text
+
+LINT_RULES = [SyllableWithoutNoteRule(), NoteWithoutSyllableRule(), OutOfRangeRule(), DoubledSyllableRule(), LateLyricRule()]
+
+def assign_syllables(notes, lyrics, tolerance):
+    """Walk the notes of a pair with the syllables sung on each, in one pass over both.
+    Each syllable belongs to the last note starting no later than tolerance ticks after it.
+    Yields (note index, tick, chord, [(lyric tick, text)]) for every note"""
+    lyric_index = 0
+    for note_index, (tick, chord) in enumerate(notes):
+        next_tick = notes[note_index + 1][0] if note_index + 1 < len(notes) else None
+        start = lyric_index
+        while lyric_index < len(lyrics) and (next_tick is None or lyrics[lyric_index][0] + tolerance < next_tick):
+            lyric_index += 1
+        yield note_index, tick, chord, lyrics[start:lyric_index]
+
+def lint_pair(notes, lyrics, tolerance, rules=LINT_RULES):
+    """Check how the lyrics of a pair fit its notes, with every rule in one pass over both.
+    Syllables belong to notes as in assign_syllables.
+    Returns sorted (tick, note index, rule name, text) findings"""
+    findings = []
+    if not notes:
+        return findings
+    
+    previous_end = None
+    for note_index, tick, chord, note_lyrics in assign_syllables(notes, lyrics, tolerance):
+        is_last = note_index == len(notes) - 1
+        syllables = [(lyric_tick - tick, text) for lyric_tick, text in note_lyrics]
+        
+        rest_before = previous_end is None or tick > previous_end + tolerance
+        step = LintStep(note_index, tick, chord, syllables, note_index == 0, is_last, rest_before, bool(lyrics), tolerance)
+        for rule in rules:
+            for finding_tick, text in rule.check(step):
+                findings.append((finding_tick, note_index, rule.name, text))
+        previous_end = max(previous_end or 0, tick + step.length)
+    
+    findings.sort()
+    return findings
+
+# Upper bounds, in beats, of the note length classes of the pair statistics:
+# sixteenths, eighths, quarters, halves, and anything longer
+DURATION_CLASS_BEATS = [0.375, 0.75, 1.5, 3.0]
+
+# Share of the sung time below and above the tessitura
+TESSITURA_MARGIN = 0.1
+
+def build_pair_statistics(notes, lyrics, ticks_per_beat, tolerance):
+    """Summarize the range and rhythm of a pair for singers in one pass over its notes and lyrics.
+    Syllables belong to notes as in assign_syllables, and a melisma ends at the next syllable or at a rest.
+    The tessitura is the range of the middle of the sung time, weighted by note length."""
+    stats = {'notes': len(notes), 'syllables': len(lyrics), 'lowest': None, 'highest': None, 'tessitura': None,
+             'durations': [0] * (len(DURATION_CLASS_BEATS) + 1),
+             'syllables_per_note': len(lyrics) / len(notes) if notes else 0.0, 'longest_melisma': (0, 0)}
+    if not notes:
+        return stats
+    
+    pitch_time = [0] * 128  # Ticks sung at each pitch
+    class_ticks = [bound * ticks_per_beat for bound in DURATION_CLASS_BEATS]
+    lowest, highest = 127, 0
+    melisma_start = None  # Note index of the syllable being held
+    previous_end = None
+    for note_index, tick, chord, note_lyrics in assign_syllables(notes, lyrics, tolerance):
+        length = 0
+        for note, _, duration, _ in chord:
+            lowest = min(lowest, note)
+            highest = max(highest, note)
+            pitch_time[note] += duration
+            length = max(length, duration)
+        stats['durations'][bisect.bisect_left(class_ticks, length)] += 1
+        has_syllable = bool(note_lyrics)
+        
+        # Melismas are counted in notes, from the note of the syllable
+        if has_syllable or (previous_end is not None and tick > previous_end + tolerance):
+            melisma_start = note_index if has_syllable else None
+        if melisma_start is not None and note_index - melisma_start + 1 > stats['longest_melisma'][0]:
+            stats['longest_melisma'] = (note_index - melisma_start + 1, melisma_start)
+        previous_end = max(previous_end or 0, tick + length)
+    
+    stats['lowest'], stats['highest'] = lowest, highest
+    
+    # Walk the pitches up to the margins of the sung time
+    total = sum(pitch_time)
+    low_time, high_time = total * TESSITURA_MARGIN, total * (1 - TESSITURA_MARGIN)
+    tessitura_low = tessitura_high = None
+    sung = 0
+    for note in range(lowest, highest + 1):
+        sung += pitch_time[note]
+        if tessitura_low is None and sung > low_time:
+            tessitura_low = note
+        if tessitura_high is None and sung >= high_time:
+            tessitura_high = note
+    stats['tessitura'] = (tessitura_low if tessitura_low is not None else lowest,
+                          tessitura_high if tessitura_high is not None else highest)
+    return stats
+
+def note_name(note):
+    """Name of a MIDI note number with its octave, middle C (60) is C4"""
+    names = lang.get('note_names').split()
+    return f"{names[note % 12]}{note // 12 - 1}"
+
+# Edit distance after which a range is reported as changed as a whole, bounds the time
+# spent comparing tracks that have little in common
+DIFF_COST_LIMIT = 500
+
+def diff_sequences(a, b):
+    """Get the changed spans between two sequences as (a_start, a_end, b_start, b_end), with
+    Myers' linear space algorithm, so long tracks with few changes compare quickly"""
+    changes = []
+    ranges = [(0, len(a), 0, len(b))]
+    while ranges:
+        a_lo, a_hi, b_lo, b_hi = ranges.pop()
+        while a_lo < a_hi and b_lo < b_hi and a[a_lo] == b[b_lo]:
+            a_lo += 1
+            b_lo += 1
+        while a_lo < a_hi and b_lo < b_hi and a[a_hi - 1] == b[b_hi - 1]:
+            a_hi -= 1
+            b_hi -= 1
+        if a_lo == a_hi or b_lo == b_hi:
+            if a_lo < a_hi or b_lo < b_hi:
+                changes.append((a_lo, a_hi, b_lo, b_hi))
+            continue
+        
+        snake = middle_snake(a, a_lo, a_hi, b, b_lo, b_hi)
+        if snake is None:
+            changes.append((a_lo, a_hi, b_lo, b_hi))
+            continue
+        # The left part is compared first so changes come out in order
+        x, y, u, v = snake
+        ranges.append((u, a_hi, v, b_hi))
+        ranges.append((a_lo, x, b_lo, y))
+    
+    # Edits on both sides of an empty snake belong to one span
+    merged = []
+    for span in changes:
+        if merged and merged[-1][1] == span[0] and merged[-1][3] == span[2]:
+            merged[-1] = (merged[-1][0], span[1], merged[-1][2], span[3])
+        else:
+            merged.append(span)
+    return merged
+
+def middle_snake(a, a_lo, a_hi, b, b_lo, b_hi):
+    """Find the middle snake of the shortest edit script between two ranges as (x, y, u, v),
+    searching from both ends at once. Returns None past DIFF_COST_LIMIT."""
+    n = a_hi - a_lo
+    m = b_hi - b_lo
+    delta = n - m
+    odd = delta % 2 == 1
+    forward = {1: 0}  # Diagonal k = x - y -> furthest x reached from the start
+    backward = {1: 0}  # The same from the end, in reversed coordinates
+    
+    for d in range(min((n + m + 1) // 2, DIFF_COST_LIMIT) + 1):
+        for k in range(-d, d + 1, 2):
+            if k == -d or (k != d and forward[k - 1] < forward[k + 1]):
+                x = forward[k + 1]
+            else:
+                x = forward[k - 1] + 1
+            y = x - k
+            start_x, start_y = x, y
+            while x < n and y < m and a[a_lo + x] == b[b_lo + y]:
+                x += 1
+                y += 1
+            forward[k] = x
+            if odd and delta - (d - 1) <= k <= delta + (d - 1) and x + backward[delta - k] >= n:
+                return a_lo + start_x, b_lo + start_y, a_lo + x, b_lo + y
+        
+        for k in range(-d, d + 1, 2):
+            if k == -d or (k != d and backward[k - 1] < backward[k + 1]):
+                x = backward[k + 1]
+            else:
+                x = backward[k - 1] + 1
+            y = x - k
+            start_x, start_y = x, y
+            while x < n and y < m and a[a_hi - 1 - x] == b[b_hi - 1 - y]:
+                x += 1
+                y += 1
+            backward[k] = x
+            if not odd and -d <= delta - k <= d and x + forward[delta - k] >= n:
+                return a_hi - x, b_hi - y, a_hi - start_x, b_hi - start_y
+    return None
+
+def build_pair_diff(notes, lyrics, other_notes, other_lyrics):
+    """Get the changes between two versions of a pair as (tick, kind, old, new) in tick order,
+    kind being 'lyrics' or 'notes' and old and new the text of the span in each version.
+    Both versions must use the same ticks per beat."""
+    changes = []
+    sequences = [
+        ('lyrics', lyrics, other_lyrics),
+        ('notes', [(tick, tuple(sorted(note[0] for note in chord))) for tick, chord in notes],
+                  [(tick, tuple(sorted(note[0] for note in chord))) for tick, chord in other_notes]),
+    ]
+    for kind, old_events, new_events in sequences:
+        for a_start, a_end, b_start, b_end in diff_sequences(old_events, new_events):
+            if a_start < len(old_events):
+                tick = old_events[a_start][0]
+            elif b_start < len(new_events):
+                tick = new_events[b_start][0]
+            else:
+                tick = old_events[-1][0]
+            changes.append((tick, kind, describe_events(old_events[a_start:a_end]), describe_events(new_events[b_start:b_end])))
+    changes.sort(key=lambda change: change[0])
+    return changes
+
+def describe_events(events):
+    parts = []
+    for _, value in events:
+        parts.append('+'.join(str(pitch) for pitch in value) if isinstance(value, tuple) else value)
+    return ' '.join(parts)
+
+# Files picked up by the folder watcher
+MIDI_EXTENSIONS = ('.mid', '.midi', '.kar')
+
+def analyze_midi_file(path):
+    """Run the full analysis of a file: track summaries, suggested pairs and lyric alignment"""
+    with open(path, 'rb') as f:
+        analysis = read_midi_analysis(f.read())
+    analysis.get_time_signature_and_tempo()
+    pairs = suggest_track_pairs(analysis.get_track_info())
+    
+    tolerance = analysis.midi_data.ticks_per_beat // 8
+    reports = [build_alignment_report(analysis.get_notes(notes_track), analysis.get_lyrics(lyrics_track), tolerance)
+               for notes_track, lyrics_track in pairs]
+    summary = {
+        'pairs': pairs,
+        'notes': sum(report['notes'] for report in reports),
+        'lyrics': sum(report['lyrics'] for report in reports),
+        'unaligned': sum(len(report['unaligned_lyrics']) for report in reports),
+    }
+    return analysis, summary
+
+class AnalysisCache:
+    """Analyses of files by path, valid while the size and modification time of the file are unchanged"""
+    def __init__(self):
+        self.entries = OrderedDict()  # Normalized path -> ((mtime, size), analysis, summary), most recently used last
+        self.lock = threading.Lock()
+
+    def file_key(self, path):
+        return os.path.normcase(os.path.abspath(path))
+
+    def file_stamp(self, path):
+        stat = os.stat(path)
+        return stat.st_mtime, stat.st_size
+
+    def get(self, path):
+        """Get (analysis, summary) if the file is unchanged since it was analyzed, or None"""
+        try:
+            stamp = self.file_stamp(path)
+        except OSError:
+            return None
+        key = self.file_key(path)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry and entry[0] == stamp:
+                self.entries.move_to_end(key)
+                return entry[1], entry[2]
+        return None
+
+    def put(self, path, stamp, analysis, summary=None):
+        key = self.file_key(path)
+        with self.lock:
+            self.entries[key] = (stamp, analysis, summary)
+            self.entries.move_to_end(key)
+
+    def get_analyses(self):
+        """(key, analysis) of the cached files, least recently used first"""
+        with self.lock:
+            return [(key, entry[1]) for key, entry in self.entries.items()]
+
+    def discard(self, key, analysis):
+        """Forget a file, unless it was analyzed again in the meantime"""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry and entry[1] is analysis:
+                del self.entries[key]
+
+class Workspace:
+    """Files kept open with their pairs and positions, under a memory budget.
+    Cached analyses of files that are not open count against the budget too.
+    The least recently used files are closed first and their analyses released."""
+    def __init__(self, budget_mb=256, analysis_cache=None, on_release=None):
+        self.budget_mb = budget_mb
+        self.analysis_cache = analysis_cache
+        self.on_release = on_release  # Called with every analysis released or dropped
+        self.entries = OrderedDict()  # Normalized path -> (path, state), most recently used last
+
+    def file_key(self, path):
+        return os.path.normcase(os.path.abspath(path))
+
+    def put(self, path, state):
+        key = self.file_key(path)
+        self.entries[key] = (path, state)
+        self.entries.move_to_end(key)
+        self.evict()
+
+    def get(self, path):
+        """Get the state of an open file, marking it as the most recently used"""
+        key = self.file_key(path)
+        if key not in self.entries:
+            return None
+        self.entries.move_to_end(key)
+        return self.entries[key][1]
+
+    def discard(self, path):
+        self.entries.pop(self.file_key(path), None)
+
+    def get_paths(self):
+        """Paths of the open files, most recently used first"""
+        return [path for path, _ in reversed(self.entries.values())]
+
+    def set_budget(self, budget_mb):
+        self.budget_mb = budget_mb
+        self.evict()
+
+    def get_closed_analyses(self):
+        """(key, analysis) of the cached files that are not open, least recently used first"""
+        if self.analysis_cache is None:
+            return []
+        open_analyses = {id(state['analysis']) for _, state in self.entries.values()}
+        return [(key, analysis) for key, analysis in self.analysis_cache.get_analyses()
+                if id(analysis) not in open_analyses]
+
+    def release(self, analysis):
+        """Release an analysis, returning the bytes freed"""
+        size = analysis.estimate_size()
+        analysis.release()
+        if self.on_release:
+            self.on_release(analysis)
+        return size - analysis.estimate_size()
+
+    def evict(self):
+        budget = self.budget_mb * 1024 * 1024
+        closed = self.get_closed_analyses()
+        total = (sum(state['analysis'].estimate_size() for _, state in self.entries.values())
+                 + sum(analysis.estimate_size() for _, analysis in closed))
+        # Compare targets and watched files give up their parsed messages first
+        for _, analysis in closed:
+            if total <= budget:
+                return
+            total -= self.release(analysis)
+        # The most recently used file stays open even if it alone exceeds the budget
+        while len(self.entries) > 1 and total > budget:
+            _, (_, state) = self.entries.popitem(last=False)
+            total -= self.release(state['analysis'])
+        # Then the raw bytes of closed files, they are read again from disk when opened
+        for key, analysis in self.get_closed_analyses():
+            if total <= budget:
+                return
+            total -= analysis.estimate_size()
+            self.analysis_cache.discard(key, analysis)
+            if self.on_release:
+                self.on_release(analysis)
+
+class FolderWatcher:
+    """Polls a folder for new or changed MIDI files and analyzes them in a worker pool,
+    so opening them later is instant"""
+    def __init__(self, folder, cache, on_update=None, interval=2.0, workers=2):
+        self.folder = folder
+        self.cache = cache
+        self.on_update = on_update
+        self.interval = interval
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.seen = {}  # Path -> (mtime, size) when it was queued
+        self.pending = set()
+        self.errors = {}  # Path -> error message of the last analysis
+        self.lock = threading.Lock()  # Guards seen, pending and errors, read from the UI thread
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self._watch, daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        self.executor.shutdown(wait=False)
+
+    def _watch(self):
+        while True:
+            try:
+                self.scan()
+            except OSError:
+                pass  # Folder missing or unreadable for now, try again later
+            if self.stop_event.wait(self.interval):
+                return
+
+    def scan(self):
+        for entry in os.scandir(self.folder):
+            if not entry.is_file() or not entry.name.lower().endswith(MIDI_EXTENSIONS):
+                continue
+            stat = entry.stat()
+            stamp = (stat.st_mtime, stat.st_size)
+            # The executor is shut down once stopped
+            if self.stop_event.is_set():
+                return
+            with self.lock:
+                if self.seen.get(entry.path) == stamp:
+                    continue
+                self.seen[entry.path] = stamp
+                self.pending.add(entry.path)
+            try:
+                self.executor.submit(self.analyze, entry.path, stamp)
+            except RuntimeError:
+                return  # Stopped while scanning
+
+    def analyze(self, path, stamp):
+        try:
+            analysis, summary = analyze_midi_file(path)
+            self.cache.put(path, stamp, analysis, summary)
+            with self.lock:
+                self.errors.pop(path, None)
+        except Exception as e:
+            with self.lock:
+                self.errors[path] = str(e) or type(e).__name__
+        finally:
+            with self.lock:
+                self.pending.discard(path)
+            if self.on_update:
+                self.on_update()
+
+    def get_file_states(self):
+        """Get (path, summary or None, error or None) for every file seen, files with problems first"""
+        with self.lock:
+            paths = sorted(self.seen)
+            errors = dict(self.errors)
+        states = []
+        for path in paths:
+            cached = self.cache.get(path)
+            states.append((path, cached[1] if cached else None, errors.get(path)))
+        
+        def _problems(state):
+            _, summary, error = state
+            if error is not None:
+                return 2
+            return 1 if summary and summary['unaligned'] else 0
+        states.sort(key=_problems, reverse=True)
+        return states
+
+SESSION_FILE = 'midi_lyric_checker_session.json'
+
+def app_data_path(name):
+    """Path of a file next to the program, which is portable and keeps its data with it"""
+    if getattr(sys, 'frozen', False):
+        folder = os.path.dirname(sys.executable)
+    else:
+        folder = os.path.dirname(os.path.abspath(__file__))
+    return os.path.join(folder, name)
+
+class SessionStore:
+    """The last session as compact JSON, written in the background shortly after each change.
+    The analysis of the session file is pickled next to it with the path and stamp of the file,
+    so restoring does not parse the file again"""
+    def __init__(self, path, delay=1.0):
+        self.path = path
+        self.analysis_path = os.path.splitext(path)[0] + '.analysis'
+        self.delay = delay
+        self.data = {}
+        self.lock = threading.Lock()
+        self.timer = None
+        self.pending_analysis = None  # (path, stamp, analysis) waiting to be pickled
+        self.analysis_writer = None
+
+    def load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self.data = json.load(f)
+        except (OSError, ValueError):
+            self.data = {}
+        return self.data
+
+    def update(self, **values):
+        """Change some values, they are written together once the delay has passed"""
+        with self.lock:
+            if all(self.data.get(key) == value for key, value in values.items()):
+                return
+            self.data.update(values)
+            if self.timer is None:
+                self.timer = threading.Timer(self.delay, self.flush)
+                self.timer.daemon = True
+                self.timer.start()
+
+    def flush(self):
+        with self.lock:
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+            text = json.dumps(self.data, ensure_ascii=False, separators=(',', ':'))
+        self.write(self.path, text.encode('utf-8'))
+
+    def save_analysis(self, path, stamp, analysis):
+        """Pickle the analysis of a file on a background thread, the latest one asked for is kept.
+        The analysis is copied here, so the thread never sees it change while pickling."""
+        snapshot = copy.copy(analysis)
+        with self.lock:
+            self.pending_analysis = (os.path.normcase(os.path.abspath(path)), list(stamp), snapshot)
+            if self.analysis_writer is not None:
+                return
+            self.analysis_writer = threading.Thread(target=self._write_analyses, daemon=True)
+            self.analysis_writer.start()
+
+    def _write_analyses(self):
+        while True:
+            with self.lock:
+                pending, self.pending_analysis = self.pending_analysis, None
+                if pending is None:
+                    self.analysis_writer = None
+                    return
+            try:
+                data = pickle.dumps(pending, pickle.HIGHEST_PROTOCOL)
+            except Exception:
+                # Restoring then parses the file again
+                logger.warning("Could not pickle the analysis of %s", pending[0], exc_info=True)
+                continue
+            self.write(self.analysis_path, data)
+
+    def wait_for_analysis(self, timeout=5.0):
+        """Let a pickle being written finish, before the program exits"""
+        writer = self.analysis_writer
+        if writer is not None:
+            writer.join(timeout)
+
+    def load_analysis(self, path, stamp):
+        """Get the pickled analysis if it belongs to this version of the file, otherwise None"""
+        try:
+            with open(self.analysis_path, 'rb') as f:
+                saved_path, saved_stamp, analysis = pickle.load(f)
+        except Exception:
+            return None
+        if saved_path != os.path.normcase(os.path.abspath(path)) or saved_stamp != list(stamp):
+            return None
+        return analysis
+
+    def write(self, path, data):
+        # Written to a temporary file first so a crash never leaves half a session
+        try:
+            with open(path + '.tmp', 'wb') as f:
+                f.write(data)
+            os.replace(path + '.tmp', path)
+        except OSError as e:
+            # The folder of the program may not be writable, the session is then not kept
+            logger.warning("Could not write %s: %s", path, e)
+
+class TrackPairingDialog(wx.Dialog):
+    def __init__(self, parent, track_info, voice_info=(), split_channels=False):
+        super().__init__(parent, title=lang.get('track_config'), size=(500, 400))
+        self.track_info = track_info
+        self.voice_info = voice_info  # (source index, track, name) of the channel voices
+        self.split_channels = split_channels
+        self.track_pairs = []
+        
+        # Create filtered lists for selection
+        self.notes_tracks = []  # Tracks with notes
+        self.lyrics_tracks = []  # Tracks with lyrics (or option for no lyrics)
+        
+        self.fill_notes_tracks()
+        
+        # Filter tracks with lyrics for lyrics selection, plus "No lyrics" option
+        for i, (name, has_notes, has_lyrics) in enumerate(track_info):
+            if has_lyrics:
+                self.lyrics_tracks.append((i, name))
+        # Always add "No lyrics" option at the end
+        self.lyrics_tracks.append((None, lang.get('no_lyrics')))
+        
+        self.init_ui()
+        
+    def fill_notes_tracks(self):
+        """Tracks with notes for notes selection, with the channel voices when tracks are split"""
+        self.notes_tracks = [(i, name) for i, (name, has_notes, _) in enumerate(self.track_info) if has_notes]
+        if self.split_channels:
+            self.notes_tracks += [(i, name) for i, _, name in self.voice_info]
+        
+    def init_ui(self):
+        panel = wx.Panel(self)
+        vbox = wx.BoxSizer(wx.VERTICAL)
+        
+        # Instructions
+        instructions = wx.StaticText(panel, label=lang.get('config_instructions'))
+        vbox.Add(instructions, 0, wx.ALL, 10)
+        
+        # Only offered when a track plays notes on several channels
+        if self.voice_info:
+            self.split_check = wx.CheckBox(panel, label=lang.get('split_channels'))
+            self.split_check.SetValue(self.split_channels)
+            self.split_check.Bind(wx.EVT_CHECKBOX, self.on_split_channels)
+            vbox.Add(self.split_check, 0, wx.ALL, 5)
+        
+        # Track pairing area
+        self.pairing_panel = wx.ScrolledWindow(panel)
+        self.pairing_panel.SetScrollRate(5, 5)
+        self.pairing_sizer = wx.BoxSizer(wx.VERTICAL)
+        self.pairing_panel.SetSizer(self.pairing_sizer)
+        vbox.Add(self.pairing_panel, 1, wx.EXPAND | wx.ALL, 5)
+        
+        # Buttons
+        btn_box = wx.BoxSizer(wx.HORIZONTAL)
+        add_btn = wx.Button(panel, label=lang.get('add_pair'))
+        add_btn.Bind(wx.EVT_BUTTON, self.on_add_pair)
+        btn_box.Add(add_btn, 0, wx.ALL, 5)
+        
+        btn_box.Add(wx.Button(panel, wx.ID_OK, lang.get('ok')), 0, wx.ALL, 5)
+        btn_box.Add(wx.Button(panel, wx.ID_CANCEL, lang.get('cancel')), 0, wx.ALL, 5)
+        vbox.Add(btn_box, 0, wx.ALIGN_CENTER | wx.ALL, 10)
+        
+        panel.SetSizer(vbox)
+        
+        # Initialize with suggested pairing
+        self.auto_suggest_pairs()
+        
+    def auto_suggest_pairs(self):
+        # Clear existing pairs
+        self.pairing_sizer.Clear(True)
+        self.track_pairs.clear()
+        
+        pairs = suggest_track_pairs(self.track_info)
+        if self.split_channels:
+            pairs = split_track_pairs(pairs, self.voice_info)
+        for notes_track, lyrics_track in pairs:
+            notes_selection = self.get_notes_track_index(notes_track)
+            lyrics_selection = self.get_lyrics_track_index(lyrics_track)
+            self.add_track_pair(notes_selection, lyrics_selection)
+        
+        # If no pairs were suggested, add at least one empty pair
+        if not self.track_pairs:
+            self.add_track_pair()
+        
+        self.pairing_panel.FitInside()
+    
+    def on_split_channels(self, event):
+        self.split_channels = self.split_check.GetValue()
+        self.fill_notes_tracks()
+        self.auto_suggest_pairs()
+    
+    def get_split_channels(self):
+        return self.split_channels
+    
+    def get_notes_track_index(self, track_idx):
+        """Get the index in the filtered notes_tracks list"""
+        for i, (idx, _) in enumerate(self.notes_tracks):
+            if idx == track_idx:
+                return i
+        return 0
+    
+    def get_lyrics_track_index(self, track_idx):
+        """Get the index in the filtered lyrics_tracks list"""
+        if track_idx is None:
+            return len(self.lyrics_tracks) - 1  # "No lyrics" option
+        for i, (idx, _) in enumerate(self.lyrics_tracks):
+            if idx == track_idx:
+                return i
+        return len(self.lyrics_tracks) - 1  # Default to "No lyrics"
+        
+    def add_track_pair(self, notes_track=0, lyrics_track=0):
+        pair_panel = wx.Panel(self.pairing_panel)
+        pair_sizer = wx.BoxSizer(wx.HORIZONTAL)
+        
+        # Notes track selection (filtered to only tracks with notes)
+        pair_sizer.Add(wx.StaticText(pair_panel, label=lang.get('notes')), 0, wx.ALIGN_CENTER_VERTICAL | wx.ALL, 5)
+        notes_choices = [name for _, name in self.notes_tracks]
+        notes_choice = wx.Choice(pair_panel, choices=notes_choices)
+        if notes_choices:  # Only set selection if there are choices
+            notes_choice.SetSelection(min(notes_track, len(notes_choices) - 1))
+        pair_sizer.Add(notes_choice, 1, wx.ALL, 5)
+        
+        # Lyrics track selection (filtered to only tracks with lyrics + "No lyrics")
         pair_sizer.Add(wx.StaticText(pair_panel, label=lang.get('lyrics')), 0, wx.ALIGN_CENTER_VERTICAL | wx.ALL, 5)
         lyrics_choices = [name for _, name in self.lyrics_tracks]
         lyrics_choice = wx.Choice(pair_panel, choices=lyrics_choices)
@@ -468,9 +2626,8 @@ class TrackPropertiesDialog(wx.Dialog):
         }
 
 class MetronomeDialog(wx.Dialog):
-    def __init__(self, parent, tempo=120, downbeat_note=76, upbeat_note=77, enabled=False):
-        super().__init__(parent, title=lang.get('metronome_settings'), size=(350, 250))
-        self.tempo = tempo
+    def __init__(self, parent, downbeat_note=76, upbeat_note=77, enabled=False):
+        super().__init__(parent, title=lang.get('metronome_settings'), size=(350, 200))
         self.downbeat_note = downbeat_note
         self.upbeat_note = upbeat_note
         self.enabled = enabled
@@ -480,12 +2637,6 @@ class MetronomeDialog(wx.Dialog):
         panel = wx.Panel(self)
         vbox = wx.BoxSizer(wx.VERTICAL)
         
-        # Tempo
-        tempo_box = wx.BoxSizer(wx.HORIZONTAL)
-        tempo_box.Add(wx.StaticText(panel, label=lang.get('tempo_bpm')), 0, wx.ALIGN_CENTER_VERTICAL | wx.ALL, 5)
-        self.tempo_spin = wx.SpinCtrl(panel, value=str(self.tempo), min=60, max=200)
-        tempo_box.Add(self.tempo_spin, 0, wx.ALL, 5)
-        
         # Downbeat note
         down_box = wx.BoxSizer(wx.HORIZONTAL)
         down_box.Add(wx.StaticText(panel, label=lang.get('downbeat_note')), 0, wx.ALIGN_CENTER_VERTICAL | wx.ALL, 5)
@@ -507,7 +2658,6 @@ class MetronomeDialog(wx.Dialog):
         btn_box.Add(wx.Button(panel, wx.ID_OK, lang.get('ok')), 0, wx.ALL, 5)
         btn_box.Add(wx.Button(panel, wx.ID_CANCEL, lang.get('cancel')), 0, wx.ALL, 5)
         
-        vbox.Add(tempo_box, 0, wx.EXPAND | wx.ALL, 5)
         vbox.Add(down_box, 0, wx.EXPAND | wx.ALL, 5)
         vbox.Add(up_box, 0, wx.EXPAND | wx.ALL, 5)
         vbox.Add(self.enable_check, 0, wx.ALL, 5)
@@ -517,57 +2667,149 @@ class MetronomeDialog(wx.Dialog):
         
     def get_values(self):
         return {
-            'tempo': self.tempo_spin.GetValue(),
             'downbeat_note': self.down_spin.GetValue(),
             'upbeat_note': self.up_spin.GetValue(),
             'enabled': self.enable_check.GetValue()
         }
 
+class AnnounceSettingsDialog(wx.Dialog):
+    def __init__(self, parent, lead_ms=150):
+        super().__init__(parent, title=lang.get('announce_settings'), size=(350, 150))
+        self.lead_ms = lead_ms
+        self.init_ui()
+        
+    def init_ui(self):
+        panel = wx.Panel(self)
+        vbox = wx.BoxSizer(wx.VERTICAL)
+        
+        # Time the announcement is issued before its note, covers the screen reader latency
+        lead_box = wx.BoxSizer(wx.HORIZONTAL)
+        lead_box.Add(wx.StaticText(panel, label=lang.get('announce_lead_ms')), 0, wx.ALIGN_CENTER_VERTICAL | wx.ALL, 5)
+        self.lead_spin = wx.SpinCtrl(panel, value=str(self.lead_ms), min=0, max=1000)
+        lead_box.Add(self.lead_spin, 0, wx.ALL, 5)
+        
+        # Buttons
+        btn_box = wx.BoxSizer(wx.HORIZONTAL)
+        btn_box.Add(wx.Button(panel, wx.ID_OK, lang.get('ok')), 0, wx.ALL, 5)
+        btn_box.Add(wx.Button(panel, wx.ID_CANCEL, lang.get('cancel')), 0, wx.ALL, 5)
+        
+        vbox.Add(lead_box, 0, wx.EXPAND | wx.ALL, 5)
+        vbox.Add(btn_box, 0, wx.ALIGN_CENTER | wx.ALL, 10)
+        
+        panel.SetSizer(vbox)
+        
+    def get_values(self):
+        return {
+            'lead_ms': self.lead_spin.GetValue()
+        }
+
 class MidiLyricChecker(wx.Frame):
     def __init__(self):
         super().__init__(None, title=lang.get('title'), size=(800, 600))
         
         # Core components
-        self.output = Auto()
+        self.output = SpeechQueue(Auto)
         self.midi_data = None
+        self.analysis = None
         self.output_port = None
-        self.play_thread = None
+        self.port_manager = MidiPortManager()
+        # The timer may keep a file descriptor for each playback thread
+        self.player = PlaybackController(self.send_output, on_exit=lambda: self.timer.close())
         
         # Data structures
-        self.track_names = []
         self.track_pairs = []
         self.notes = []
         self.timed_lyrics = []
+        self.lyric_models = []
         self.track_properties = {}
+        # Tracks playing notes on several channels are offered as one voice per channel
+        self.split_channels = False
         
         # State variables
         self.current_pair = 0
         self.current_note_index = 0
-        self.playing = False
         
         # Metronome settings
         self.metronome_enabled = False
-        self.tempo = 120
         self.downbeat_note = 76
         self.upbeat_note = 77
-        self.beat_count = 0
-        self.metronome_thread = None
         # Accessibility settings
         self.auto_announce_lyrics = True
+        self.announce_lead_ms = 150  # Lyrics are announced this early during playback
         self.last_announced_lyric = None
         self.current_single_lyric = None
         
+        # Notes of the chord preview still to be released, (seconds, channel, note)
+        self.preview_releases = []
+        self.preview_lock = threading.Lock()
+        self.tempo_map = None
+        
+        # Playback plans of recently played pairs
+        self.plan_cache = OrderedDict()
+        self.plan_lock = threading.Lock()
+        
+        # Practice speed of playback, 1.0 is the tempo of the file
+        self.playback_speed = 1.0
+        
+        # Plain sleep until the timers are measured in the background
+        self.timer = SleepTimer()
+        self.timer_measurements = {}
+        self.fine_wait = TIMER_FINE_WAIT
+        self.lateness = LatenessStats()
+        threading.Thread(target=self.calibrate_timer, daemon=True).start()
+        
+        # A/B loop, note indices of the current pair
+        self.loop_start = None
+        self.loop_end = None
+        self.loop_enabled = False
+        
+        # Bar/beat navigation, one index per pair
+        self.bar_indexes = []
+        self.bars_per_phrase = 4
+        
+        # Range and rhythm summary of each pair, shown in the status field on request
+        self.pair_statistics = []
+        self.show_statistics = False
+        
+        # Analyses of files, filled by loads and by the folder watcher
+        self.analysis_cache = AnalysisCache()
+        # Files switched between without reloading, with their pairs and positions
+        self.workspace = Workspace(analysis_cache=self.analysis_cache, on_release=self.drop_playback_plans)
+        self.folder_watcher = None
+        
+        # Changes against another version of the file, (pair index, note index, kind, old, new)
+        self.diff_changes = []
+        self.diff_position = -1
+        
+        # Lyric check findings of all pairs, (pair index, note index, rule name, text)
+        self.lint_findings = []
+        self.lint_position = -1
+        
+        # Lyric search
+        self.search_index = None
+        self.last_search = ""
+        
+        # Last session, restored on launch and saved as it changes
+        self.session = SessionStore(app_data_path(SESSION_FILE))
+        self.current_file = None
+        self.pair_positions = {}  # Pair index -> note index to come back to
+        
         # UI elements for language updates
         self.track_label = None
         self.lyric_label = None
         self.status_label = None
         self.instructions = None
+        self.rendered_lyrics = None  # LyricModel whose text is in the lyric display
+        self.lyric_window = (0, 0)  # First and end row of it in the lyric display
         
         self.init_ui()
         self.Bind(wx.EVT_CLOSE, self.on_close)
         
-        # Auto-select MIDI device
-        wx.CallAfter(self.auto_select_default_midi)
+        # Enumerate MIDI devices in the background, then auto-select one
+        if MIDI_AVAILABLE:
+            self.port_manager.start_enumeration(lambda: wx.CallAfter(self.auto_select_default_midi))
+        
+        wx.CallAfter(self.restore_session)
 
     def init_ui(self):
         panel = wx.Panel(self)
@@ -607,25 +2849,13 @@ class MidiLyricChecker(wx.Frame):
     def auto_select_default_midi(self):
         if not MIDI_AVAILABLE:
             return False
+        if self.output_port:
+            return True
             
         try:
-            ports = get_output_names()
-            if ports:
-                selected_port = None
-                # Look for preferred Windows MIDI devices
-                for candidate in ['Microsoft GS Wavetable Synth', 'Windows MIDI', 'MIDI Mapper', 'Wavetable']:
-                    for port in ports:
-                        if candidate.lower() in port.lower():
-                            selected_port = port
-                            break
-                    if selected_port:
-                        break
-                
-                # If no preferred device found, use the first available
-                if not selected_port:
-                    selected_port = ports[0]
-                
-                self.output_port = open_output(selected_port)
+            selected_port = self.port_manager.get_default_port_name()
+            if selected_port:
+                self.output_port = self.port_manager.select(selected_port)
                 self.output.speak(f"{lang.get('midi_device')} {selected_port}", interrupt=False)
                 return True
         except Exception as e:
@@ -647,6 +2877,19 @@ class MidiLyricChecker(wx.Frame):
         file_menu.Append(107, lang.get('metronome_settings_menu'))
         file_menu.Append(108, lang.get('toggle_metronome'))
         file_menu.Append(109, lang.get('toggle_auto_announce'))
+        file_menu.Append(111, lang.get('announce_settings_menu'))
+        file_menu.Append(112, lang.get('export_menu'))
+        file_menu.Append(113, lang.get('find_lyric_menu'))
+        file_menu.Append(114, lang.get('find_next_menu'))
+        file_menu.Append(115, lang.get('go_to_bar_menu'))
+        file_menu.Append(116, lang.get('watch_folder_menu'))
+        file_menu.Append(117, lang.get('watched_files_menu'))
+        file_menu.Append(118, lang.get('open_files_menu'))
+        file_menu.Append(119, lang.get('workspace_memory_menu'))
+        file_menu.Append(120, lang.get('compare_menu'))
+        file_menu.Append(121, lang.get('changes_menu'))
+        file_menu.Append(122, lang.get('lint_menu'))
+        file_menu.Append(123, lang.get('statistics_menu'))
         file_menu.AppendSeparator()
         file_menu.Append(110, lang.get('quit'))
         menubar.Append(file_menu, lang.get('file_menu'))
@@ -669,6 +2912,19 @@ class MidiLyricChecker(wx.Frame):
         self.Bind(wx.EVT_MENU, self.on_metronome_settings, id=107)
         self.Bind(wx.EVT_MENU, self.on_toggle_metronome, id=108)
         self.Bind(wx.EVT_MENU, self.on_toggle_auto_announce, id=109)
+        self.Bind(wx.EVT_MENU, self.on_announce_settings, id=111)
+        self.Bind(wx.EVT_MENU, self.on_export, id=112)
+        self.Bind(wx.EVT_MENU, self.on_find_lyric, id=113)
+        self.Bind(wx.EVT_MENU, self.on_find_next, id=114)
+        self.Bind(wx.EVT_MENU, self.on_go_to_bar, id=115)
+        self.Bind(wx.EVT_MENU, self.on_watch_folder, id=116)
+        self.Bind(wx.EVT_MENU, self.on_watched_files, id=117)
+        self.Bind(wx.EVT_MENU, self.on_open_files, id=118)
+        self.Bind(wx.EVT_MENU, self.on_workspace_memory, id=119)
+        self.Bind(wx.EVT_MENU, self.on_compare, id=120)
+        self.Bind(wx.EVT_MENU, self.on_changes, id=121)
+        self.Bind(wx.EVT_MENU, self.on_lint, id=122)
+        self.Bind(wx.EVT_MENU, self.on_statistics, id=123)
         self.Bind(wx.EVT_MENU, self.on_quit, id=110)
         self.Bind(wx.EVT_MENU, self.on_language_english, id=201)
         self.Bind(wx.EVT_MENU, self.on_language_spanish, id=202)
@@ -678,6 +2934,7 @@ class MidiLyricChecker(wx.Frame):
         modifiers = event.GetModifiers()
         alt = bool(modifiers & wx.MOD_ALT)
         ctrl = bool(modifiers & wx.MOD_CONTROL)
+        shift = bool(modifiers & wx.MOD_SHIFT)
 
         if (alt and ctrl) or (alt and keycode == wx.WXK_F4):
             event.Skip()
@@ -706,16 +2963,36 @@ class MidiLyricChecker(wx.Frame):
             self.on_toggle_metronome(event)
         elif keycode == wx.WXK_F6 and not alt and not ctrl:
             self.on_toggle_auto_announce(event)
+        elif keycode == wx.WXK_F3 and not alt and not ctrl:
+            self.on_find_next(event)
+        elif keycode == wx.WXK_F7 and not alt and not ctrl:
+            self.set_loop_marker(start=True)
+        elif keycode == wx.WXK_F8 and not alt and not ctrl:
+            self.set_loop_marker(start=False)
+        elif keycode == wx.WXK_F9 and not alt and not ctrl:
+            self.toggle_loop()
+        elif keycode == wx.WXK_F12 and not alt and not ctrl:
+            self.go_to_change(self.diff_position + (-1 if shift else 1))
+        elif keycode == wx.WXK_F11 and not alt and not ctrl:
+            self.go_to_finding(self.lint_position + (-1 if shift else 1))
         elif alt and keycode == wx.WXK_RIGHT and not ctrl:
             self.navigate_next()
         elif alt and keycode == wx.WXK_LEFT and not ctrl:
             self.navigate_previous()
+        elif ctrl and keycode == wx.WXK_UP and not alt:
+            self.change_speed(SPEED_STEP)
+        elif ctrl and keycode == wx.WXK_DOWN and not alt:
+            self.change_speed(-SPEED_STEP)
+        elif alt and keycode == wx.WXK_DOWN and not ctrl:
+            self.move_by_bars(1)
+        elif alt and keycode == wx.WXK_UP and not ctrl:
+            self.move_by_bars(-1)
         else:
             event.Skip()
 
     def toggle_playback(self):
-        if self.playing:
-            self.playing = False
+        if self.player.is_playing():
+            self.player.stop()
             self.output.speak(lang.get('paused'), interrupt=True)
         else:
             self.output.speak(lang.get('playing'), interrupt=True)
@@ -733,15 +3010,72 @@ class MidiLyricChecker(wx.Frame):
         self.output.speak(lang.get('end'), interrupt=True)
 
     def jump_backward(self):
-        self.current_note_index = max(0, self.current_note_index - 8)
-        self.update_displays()
-        self.output.speak(f"{lang.get('position')} {self.current_note_index + 1}", interrupt=True)
+        self.move_by_bars(-self.bars_per_phrase)
 
     def jump_forward(self):
-        notes = self.notes[self.current_pair]
-        self.current_note_index = min(len(notes) - 1, self.current_note_index + 8)
+        self.move_by_bars(self.bars_per_phrase)
+
+    def move_by_bars(self, bars):
+        bar_index = self.bar_indexes[self.current_pair]
+        self.current_note_index = bar_index.move_by_bars(self.current_note_index, bars)
+        self.update_displays()
+        bar, _ = bar_index.bar_beat(self.current_note_index)
+        self.output.speak(f"{lang.get('bar')} {bar}", interrupt=True)
+
+    def go_to_bar(self, bar):
+        """Jump to the first note of a 1-based bar"""
+        bar_index = self.bar_indexes[self.current_pair]
+        self.current_note_index = bar_index.first_note_in_bar(bar - 1)
         self.update_displays()
-        self.output.speak(f"{lang.get('position')} {self.current_note_index + 1}", interrupt=True)
+        bar, _ = bar_index.bar_beat(self.current_note_index)
+        self.output.speak(f"{lang.get('bar')} {bar}", interrupt=True)
+
+    def change_speed(self, step):
+        """Change the playback speed, also while playing"""
+        speed = round(self.playback_speed + step, 2)
+        self.playback_speed = min(max(speed, MIN_SPEED), MAX_SPEED)
+        self.output.speak(f"{lang.get('speed')} {round(self.playback_speed * 100)}%", interrupt=True)
+        self.update_status_display()
+        self.save_session()
+
+    def set_loop_marker(self, start):
+        if start:
+            self.loop_start = self.current_note_index
+            self.output.speak(f"{lang.get('loop_start_set')} {self.current_note_index + 1}", interrupt=True)
+        else:
+            self.loop_end = self.current_note_index
+            self.output.speak(f"{lang.get('loop_end_set')} {self.current_note_index + 1}", interrupt=True)
+        self.update_status_display()
+
+    def toggle_loop(self):
+        if self.loop_start is None or self.loop_end is None:
+            self.output.speak(lang.get('loop_needs_markers'), interrupt=True)
+            return
+        self.loop_enabled = not self.loop_enabled
+        self.output.speak(lang.get('loop_on') if self.loop_enabled else lang.get('loop_off'), interrupt=True)
+        self.update_status_display()
+
+    def clear_loop(self):
+        self.loop_start = None
+        self.loop_end = None
+        self.loop_enabled = False
+
+    def get_loop_ticks(self):
+        """Get (start tick, end tick) of the A/B loop of the current pair, or None when it is off.
+        The loop runs from note A up to the next note after note B."""
+        notes = self.notes[self.current_pair] if self.current_pair < len(self.notes) else []
+        if not self.loop_enabled or self.loop_start is None or self.loop_end is None or not notes:
+            return None
+        first, last = sorted((min(self.loop_start, len(notes) - 1), min(self.loop_end, len(notes) - 1)))
+        note_ticks = [note[0] for note in notes]
+        start_tick = note_ticks[first]
+        after_last = bisect.bisect_right(note_ticks, note_ticks[last])
+        if after_last < len(notes):
+            end_tick = note_ticks[after_last]
+        else:
+            notes_track_idx, _ = self.track_pairs[self.current_pair]
+            end_tick = max(sum(msg.time for msg in self.analysis.get_track(notes_track_idx)), start_tick + 1)
+        return start_tick, end_tick
 
     def navigate_next(self):
         notes = self.notes[self.current_pair]
@@ -761,24 +3095,25 @@ class MidiLyricChecker(wx.Frame):
     def announce_lyric_if_changed(self):
         if self.auto_announce_lyrics and self.current_single_lyric:
             if self.current_single_lyric != self.last_announced_lyric and self.current_single_lyric != lang.get('no_lyrics_found'):
-                self.output.speak(self.current_single_lyric, interrupt=True)
+                self.output.speak(self.current_single_lyric, interrupt=True, droppable=True)
                 self.last_announced_lyric = self.current_single_lyric
 
     def play_current_note(self):
         if not MIDI_AVAILABLE or not self.output_port:
             return
             
-        notes = self.notes[self.current_pair]
-        _, note, channel = notes[self.current_note_index] if len(notes[self.current_note_index]) == 3 else (notes[self.current_note_index][0], notes[self.current_note_index][1], 0)
+        tick, chord = self.notes[self.current_pair][self.current_note_index]
         
+        channel = None
         if self.current_pair in self.track_properties:
             channel = self.track_properties[self.current_pair]['channel']
         
-        self.play_note(note, channel)
+        self.play_chord(tick, chord, channel)
 
     def update_displays(self):
         self.update_lyric_display()
         self.update_status_display()
+        self.save_session()
 
     # Language switching methods
     def on_language_english(self, event):
@@ -817,7 +3152,10 @@ class MidiLyricChecker(wx.Frame):
     def on_open(self, event):
         dlg = wx.FileDialog(self, lang.get('open_midi_file'), wildcard=lang.get('midi_files'), style=wx.FD_OPEN)
         if dlg.ShowModal() == wx.ID_OK:
-            self.load_midi(dlg.GetPath())
+            if self.workspace.get(dlg.GetPath()) is not None:
+                self.switch_to_file(dlg.GetPath())
+            else:
+                self.load_midi(dlg.GetPath())
         dlg.Destroy()
 
     def on_configure_tracks(self, event):
@@ -825,22 +3163,10 @@ class MidiLyricChecker(wx.Frame):
             wx.MessageBox(lang.get('no_file_loaded'), lang.get('no_file_loaded_title'), wx.OK | wx.ICON_WARNING)
             return
             
-        # Analyze tracks
-        track_info = []
-        for i, track in enumerate(self.midi_data.tracks):
-            name = f"{lang.get('track')} {i + 1}"
-            for msg in track:
-                if msg.type == 'track_name':
-                    name = f"{lang.get('track')} {i + 1}: {msg.name.strip()}"
-                    break
-            
-            has_notes, has_lyrics = self.analyze_track_content(track)
-            track_info.append((name, has_notes, has_lyrics))
-        
-        dlg = TrackPairingDialog(self, track_info)
+        dlg = self.create_pairing_dialog(self.analysis)
         if dlg.ShowModal() == wx.ID_OK:
-            self.track_pairs = dlg.get_track_pairs()
-            self.process_tracks()
+            self.split_channels = dlg.get_split_channels()
+            self.set_track_pairs(dlg.get_track_pairs())
             self.update_track_list()
             
             if self.track_pairs:
@@ -856,9 +3182,11 @@ class MidiLyricChecker(wx.Frame):
         dlg.Destroy()
 
     def on_clear(self, event):
-        self.playing = False
+        self.player.stop()
         self.track_list.Clear()
         self.lyric_display.Clear()
+        self.rendered_lyrics = None
+        self.lyric_models = []
         self.status_display.Clear()
         self.notes.clear()
         self.timed_lyrics.clear()
@@ -867,25 +3195,26 @@ class MidiLyricChecker(wx.Frame):
         self.current_note_index = 0
         self.last_announced_lyric = None
         self.midi_data = None
+        self.analysis = None
+        self.search_index = None
+        self.bar_indexes = []
+        self.pair_statistics = []
+        self.clear_loop()
+        self.diff_changes = []
+        self.lint_findings = []
+        if self.current_file:
+            self.workspace.discard(self.current_file)
+        self.current_file = None
+        self.pair_positions = {}
+        self.session.update(file=None)
 
     def on_refresh(self, event):
         if self.midi_data:
-            # Re-analyze and show dialog again
-            track_info = []
-            for i, track in enumerate(self.midi_data.tracks):
-                name = f"{lang.get('track')} {i + 1}"
-                for msg in track:
-                    if msg.type == 'track_name':
-                        name = f"{lang.get('track')} {i + 1}: {msg.name.strip()}"
-                        break
-                
-                has_notes, has_lyrics = self.analyze_track_content(track)
-                track_info.append((name, has_notes, has_lyrics))
-            
-            dlg = TrackPairingDialog(self, track_info)
+            # Show dialog again, track analysis is reused from memory
+            dlg = self.create_pairing_dialog(self.analysis)
             if dlg.ShowModal() == wx.ID_OK:
-                self.track_pairs = dlg.get_track_pairs()
-                self.process_tracks()
+                self.split_channels = dlg.get_split_channels()
+                self.set_track_pairs(dlg.get_track_pairs())
                 self.update_track_list()
                 
                 if self.track_pairs:
@@ -902,7 +3231,7 @@ class MidiLyricChecker(wx.Frame):
             return
             
         try:
-            ports = get_output_names()
+            ports = self.port_manager.get_port_names()
             if not ports:
                 wx.MessageBox(lang.get('no_midi_devices'), lang.get('no_midi_devices_title'), wx.OK | wx.ICON_WARNING)
                 return
@@ -911,9 +3240,9 @@ class MidiLyricChecker(wx.Frame):
             if dlg.ShowModal() == wx.ID_OK:
                 selected = dlg.GetStringSelection()
                 try:
-                    if self.output_port:
-                        self.output_port.close()
-                    self.output_port = open_output(selected)
+                    # Previously used devices stay open in the pool
+                    self.output_port = self.port_manager.select(selected)
+                    self.apply_track_properties()
                 except Exception as e:
                     wx.MessageBox(f"{lang.get('error_opening_device')}:\n{str(e)}", lang.get('error'), wx.OK | wx.ICON_ERROR)
             dlg.Destroy()
@@ -922,21 +3251,26 @@ class MidiLyricChecker(wx.Frame):
 
     def on_track_properties(self, event):
         if self.current_pair < len(self.track_pairs):
-            props = self.track_properties.get(self.current_pair, {'channel': 1, 'instrument': 1, 'bank': 0, 'volume': 100})
+            # A channel voice starts out on its own channel
+            voice = self.analysis.get_voice(self.track_pairs[self.current_pair][0])
+            props = self.track_properties.get(self.current_pair, {'channel': voice[1] + 1 if voice else 1, 'instrument': 1, 'bank': 0, 'volume': 100})
             dlg = TrackPropertiesDialog(self, **props)
             if dlg.ShowModal() == wx.ID_OK:
                 self.track_properties[self.current_pair] = dlg.get_values()
                 self.apply_track_properties()
+                self.prepare_playback_plan()
+                self.save_session()
             dlg.Destroy()
 
     def on_metronome_settings(self, event):
-        dlg = MetronomeDialog(self, self.tempo, self.downbeat_note, self.upbeat_note, self.metronome_enabled)
+        dlg = MetronomeDialog(self, self.downbeat_note, self.upbeat_note, self.metronome_enabled)
         if dlg.ShowModal() == wx.ID_OK:
             values = dlg.get_values()
-            self.tempo = values['tempo']
             self.downbeat_note = values['downbeat_note']
             self.upbeat_note = values['upbeat_note']
             self.metronome_enabled = values['enabled']
+            self.prepare_playback_plan()
+            self.save_session()
         dlg.Destroy()
 
     def on_toggle_metronome(self, event):
@@ -944,52 +3278,514 @@ class MidiLyricChecker(wx.Frame):
         status = lang.get('metronome_on') if self.metronome_enabled else lang.get('metronome_off')
         self.output.speak(status, interrupt=True)
         self.update_status_display()
+        self.save_session()
+
+    def on_toggle_auto_announce(self, event):
+        self.auto_announce_lyrics = not self.auto_announce_lyrics
+        status = lang.get('auto_announce_on') if self.auto_announce_lyrics else lang.get('auto_announce_off')
+        self.output.speak(status, interrupt=True)
+        self.update_status_display()
+        self.save_session()
+
+    def on_announce_settings(self, event):
+        dlg = AnnounceSettingsDialog(self, self.announce_lead_ms)
+        if dlg.ShowModal() == wx.ID_OK:
+            self.announce_lead_ms = dlg.get_values()['lead_ms']
+            self.save_session()
+        dlg.Destroy()
+
+    def on_export(self, event):
+        if not self.midi_data or not self.track_pairs:
+            wx.MessageBox(lang.get('no_file_loaded'), lang.get('no_file_loaded_title'), wx.OK | wx.ICON_WARNING)
+            return
+        if not MIDI_AVAILABLE:
+            wx.MessageBox(lang.get('midi_not_available'), lang.get('midi_not_available_title'), wx.OK | wx.ICON_WARNING)
+            return
+        
+        dlg = wx.MultiChoiceDialog(self, lang.get('export_pairs_prompt'), lang.get('export_title'), self.track_list.GetItems())
+        dlg.SetSelections([self.current_pair])
+        if dlg.ShowModal() != wx.ID_OK or not dlg.GetSelections():
+            dlg.Destroy()
+            return
+        pair_indices = dlg.GetSelections()
+        dlg.Destroy()
+        
+        dlg = wx.FileDialog(self, lang.get('export_title'), wildcard=lang.get('export_files'), style=wx.FD_SAVE | wx.FD_OVERWRITE_PROMPT)
+        if dlg.ShowModal() == wx.ID_OK:
+            path = dlg.GetPath()
+            
+            def _export():
+                try:
+                    self.export_pairs(path, pair_indices)
+                    self.output.speak(lang.get('export_done'), interrupt=False)
+                except Exception as e:
+                    wx.CallAfter(wx.MessageBox, f"{lang.get('error_exporting')} {e}", lang.get('error'), wx.OK | wx.ICON_ERROR)
+            
+            # Rendering can take a moment, keep the UI responsive
+            threading.Thread(target=_export, daemon=True).start()
+        dlg.Destroy()
+
+    def on_find_lyric(self, event):
+        if not self.search_index:
+            wx.MessageBox(lang.get('no_file_loaded'), lang.get('no_file_loaded_title'), wx.OK | wx.ICON_WARNING)
+            return
+        dlg = wx.TextEntryDialog(self, lang.get('find_lyric_prompt'), lang.get('find_lyric_title'), self.last_search)
+        if dlg.ShowModal() == wx.ID_OK:
+            self.last_search = dlg.GetValue()
+            self.find_lyric(self.last_search)
+        dlg.Destroy()
+
+    def on_find_next(self, event):
+        if not self.last_search:
+            self.on_find_lyric(event)
+        elif self.search_index:
+            self.find_lyric(self.last_search)
+
+    def find_lyric(self, query):
+        """Jump to the next match after the current position, wrapping around"""
+        matches = self.search_index.search(query)
+        if not matches:
+            self.output.speak(lang.get('no_matches'), interrupt=True)
+            return
+        
+        position = bisect.bisect_right(matches, (self.current_pair, self.current_note_index))
+        if position >= len(matches):
+            position = 0
+        pair_index, note_index = matches[position]
+        
+        if pair_index != self.current_pair:
+            self.select_pair(pair_index)
+        self.current_note_index = note_index
+        self.update_displays()
+        self.output.speak(f"{lang.get('match')} {position + 1} {lang.get('of')} {len(matches)}: {self.current_single_lyric or ''}", interrupt=True)
+        self.last_announced_lyric = self.current_single_lyric
+
+    def on_go_to_bar(self, event):
+        if not self.notes or self.current_pair >= len(self.notes) or not self.notes[self.current_pair]:
+            wx.MessageBox(lang.get('no_file_loaded'), lang.get('no_file_loaded_title'), wx.OK | wx.ICON_WARNING)
+            return
+        bar_index = self.bar_indexes[self.current_pair]
+        bar, _ = bar_index.bar_beat(self.current_note_index)
+        dlg = wx.NumberEntryDialog(self, lang.get('go_to_bar_prompt'), '', lang.get('go_to_bar_title'), bar, 1, max(1, bar_index.bar_count()))
+        if dlg.ShowModal() == wx.ID_OK:
+            self.go_to_bar(dlg.GetValue())
+        dlg.Destroy()
+
+    def on_watch_folder(self, event):
+        dlg = wx.DirDialog(self, lang.get('watch_folder_title'))
+        if dlg.ShowModal() == wx.ID_OK:
+            if self.folder_watcher:
+                self.folder_watcher.stop()
+            self.folder_watcher = FolderWatcher(dlg.GetPath(), self.analysis_cache)
+            self.folder_watcher.start()
+            self.output.speak(f"{lang.get('watching_folder')} {dlg.GetPath()}", interrupt=True)
+        dlg.Destroy()
+
+    def on_watched_files(self, event):
+        states = self.folder_watcher.get_file_states() if self.folder_watcher else []
+        if not states:
+            wx.MessageBox(lang.get('no_watched_files'), lang.get('watched_files_title'), wx.OK | wx.ICON_INFORMATION)
+            return
+        
+        choices = []
+        for path, summary, error in states:
+            if error is not None:
+                state = f"{lang.get('error')}: {error}"
+            elif summary is None:
+                state = lang.get('analyzing')
+            elif summary['unaligned']:
+                state = f"{summary['unaligned']} {lang.get('unaligned_lyrics')}"
+            else:
+                state = lang.get('no_problems')
+            choices.append(f"{os.path.basename(path)}: {state}")
+        
+        dlg = wx.SingleChoiceDialog(self, lang.get('watched_files_prompt'), lang.get('watched_files_title'), choices)
+        if dlg.ShowModal() == wx.ID_OK:
+            self.load_midi(states[dlg.GetSelection()][0])
+        dlg.Destroy()
+
+    def on_open_files(self, event):
+        paths = self.workspace.get_paths()
+        if not paths:
+            wx.MessageBox(lang.get('no_open_files'), lang.get('open_files_title'), wx.OK | wx.ICON_INFORMATION)
+            return
+        
+        dlg = wx.SingleChoiceDialog(self, lang.get('open_files_prompt'), lang.get('open_files_title'),
+                                    [os.path.basename(path) for path in paths])
+        if dlg.ShowModal() == wx.ID_OK:
+            self.switch_to_file(paths[dlg.GetSelection()])
+        dlg.Destroy()
+
+    def on_workspace_memory(self, event):
+        dlg = wx.NumberEntryDialog(self, lang.get('workspace_memory_prompt'), '', lang.get('workspace_memory_title'),
+                                   self.workspace.budget_mb, 16, 4096)
+        if dlg.ShowModal() == wx.ID_OK:
+            self.workspace.set_budget(dlg.GetValue())
+            self.save_session()
+        dlg.Destroy()
+
+    def on_compare(self, event):
+        if not self.midi_data or not self.track_pairs:
+            wx.MessageBox(lang.get('no_file_loaded'), lang.get('no_file_loaded_title'), wx.OK | wx.ICON_WARNING)
+            return
+        
+        dlg = wx.FileDialog(self, lang.get('compare_title'), wildcard=lang.get('midi_files'), style=wx.FD_OPEN)
+        if dlg.ShowModal() == wx.ID_OK:
+            try:
+                self.compare_with(dlg.GetPath())
+            except Exception as e:
+                wx.MessageBox(f"{lang.get('error_loading_midi')}: {e}", lang.get('error'), wx.OK | wx.ICON_ERROR)
+                dlg.Destroy()
+                return
+            if self.diff_changes:
+                self.output.speak(f"{len(self.diff_changes)} {lang.get('changes_found')}", interrupt=True)
+                self.on_changes(event)
+            else:
+                self.output.speak(lang.get('no_changes'), interrupt=True)
+        dlg.Destroy()
+
+    def compare_with(self, path):
+        """Diff the lyrics and notes of every pair against the same pair of another version of the file"""
+        other = self.get_analysis(path)
+        state = self.workspace.get(path)
+        if state:
+            other_pairs = state['track_pairs']
+        elif self.pairs_fit(other, self.track_pairs):
+            # Versions of a file usually keep their tracks, compare the pairs chosen for this one
+            other_pairs = self.track_pairs
+        else:
+            other_pairs = suggest_track_pairs(other.get_track_info())
+        
+        # Ticks of the other version are brought to the resolution of this one
+        scale = self.midi_data.ticks_per_beat / other.midi_data.ticks_per_beat
+        
+        self.diff_changes = []
+        self.diff_position = -1
+        for pair_index, (other_notes_track, other_lyrics_track) in enumerate(other_pairs[:len(self.track_pairs)]):
+            other_notes = [(round(tick * scale), chord) for tick, chord in other.get_notes(other_notes_track)]
+            other_lyrics = [(round(tick * scale), text) for tick, text in other.get_lyrics(other_lyrics_track)]
+            note_ticks = [note[0] for note in self.notes[pair_index]]
+            for tick, kind, old, new in build_pair_diff(self.notes[pair_index], self.timed_lyrics[pair_index], other_notes, other_lyrics):
+                note_index = max(0, bisect.bisect_right(note_ticks, tick) - 1)
+                self.diff_changes.append((pair_index, note_index, kind, old, new))
+
+    def pairs_fit(self, analysis, pairs):
+        """Whether every track and voice of the pairs exists in a file"""
+        source_count = analysis.get_source_count()
+        return all(notes_track < source_count and (lyrics_track is None or lyrics_track < source_count)
+                   for notes_track, lyrics_track in pairs)
+
+    def describe_change(self, change):
+        pair_index, note_index, kind, old, new = change
+        label = lang.get('lyrics') if kind == 'lyrics' else lang.get('notes')
+        position = f"{lang.get('pair_prefix')} {pair_index + 1}"
+        if pair_index < len(self.bar_indexes) and self.notes[pair_index]:
+            bar, beat = self.bar_indexes[pair_index].bar_beat(note_index)
+            position += f", {lang.get('bar')} {bar}:{beat}"
+        return f"{position}, {label} {old or '-'}, {lang.get('now')} {new or '-'}"
+
+    def on_changes(self, event):
+        if not self.diff_changes:
+            wx.MessageBox(lang.get('no_comparison'), lang.get('changes_title'), wx.OK | wx.ICON_INFORMATION)
+            return
+        
+        dlg = wx.SingleChoiceDialog(self, lang.get('changes_prompt'), lang.get('changes_title'),
+                                    [self.describe_change(change) for change in self.diff_changes])
+        if dlg.ShowModal() == wx.ID_OK:
+            self.go_to_change(dlg.GetSelection())
+        dlg.Destroy()
+
+    def go_to_change(self, position):
+        """Jump to a change of the last comparison, wrapping around at both ends"""
+        if not self.diff_changes:
+            self.output.speak(lang.get('no_comparison'), interrupt=True)
+            return
+        
+        self.diff_position = position % len(self.diff_changes)
+        change = self.diff_changes[self.diff_position]
+        pair_index, note_index = change[0], change[1]
+        if pair_index != self.current_pair:
+            self.select_pair(pair_index)
+        self.current_note_index = note_index
+        self.update_displays()
+        self.output.speak(f"{lang.get('change')} {self.diff_position + 1} {lang.get('of')} {len(self.diff_changes)}: {self.describe_change(change)}", interrupt=True)
+
+    def on_statistics(self, event):
+        """Show or hide the statistics of the pair in the status field, they are spoken when shown"""
+        if self.current_pair >= len(self.pair_statistics):
+            wx.MessageBox(lang.get('no_file_loaded'), lang.get('no_file_loaded_title'), wx.OK | wx.ICON_WARNING)
+            return
+        
+        self.show_statistics = not self.show_statistics
+        if self.show_statistics:
+            self.output.speak(', '.join(self.describe_statistics(self.pair_statistics[self.current_pair])), interrupt=True)
+        else:
+            self.output.speak(lang.get('statistics_hidden'), interrupt=True)
+        self.update_status_display()
+
+    def describe_statistics(self, stats):
+        """Lines of text for the statistics of a pair"""
+        if not stats['notes']:
+            return [lang.get('no_notes_pair')]
+        
+        lines = [f"{lang.get('range')} {note_name(stats['lowest'])}-{note_name(stats['highest'])}",
+                 f"{lang.get('tessitura')} {note_name(stats['tessitura'][0])}-{note_name(stats['tessitura'][1])}",
+                 f"{lang.get('durations')} {'/'.join(str(count) for count in stats['durations'])}"]
+        if stats['syllables']:
+            melisma_notes, melisma_start = stats['longest_melisma']
+            lines.append(f"{lang.get('syllables_per_note')} {stats['syllables_per_note']:.2f}")
+            lines.append(f"{lang.get('longest_melisma')} {melisma_notes} {lang.get('notes_word')}, {lang.get('from_note')} {melisma_start + 1}")
+        return lines
+
+    def on_lint(self, event):
+        if not self.midi_data or not self.track_pairs:
+            wx.MessageBox(lang.get('no_file_loaded'), lang.get('no_file_loaded_title'), wx.OK | wx.ICON_WARNING)
+            return
+        
+        self.lint_tracks()
+        if not self.lint_findings:
+            self.output.speak(lang.get('no_problems'), interrupt=True)
+            return
+        
+        self.output.speak(f"{len(self.lint_findings)} {lang.get('problems_found')}", interrupt=True)
+        dlg = wx.SingleChoiceDialog(self, lang.get('lint_prompt'), lang.get('lint_title'),
+                                    [self.describe_finding(finding) for finding in self.lint_findings])
+        if dlg.ShowModal() == wx.ID_OK:
+            self.go_to_finding(dlg.GetSelection())
+        dlg.Destroy()
+
+    def lint_tracks(self):
+        """Check the lyrics of every pair against its notes"""
+        tolerance = self.midi_data.ticks_per_beat // 8
+        self.lint_findings = []
+        self.lint_position = -1
+        for pair_index, notes in enumerate(self.notes):
+            for _, note_index, rule, text in lint_pair(notes, self.timed_lyrics[pair_index], tolerance):
+                self.lint_findings.append((pair_index, note_index, rule, text))
+
+    def describe_finding(self, finding):
+        pair_index, note_index, rule, text = finding
+        position = f"{lang.get('pair_prefix')} {pair_index + 1}"
+        if pair_index < len(self.bar_indexes) and self.notes[pair_index]:
+            bar, beat = self.bar_indexes[pair_index].bar_beat(note_index)
+            position += f", {lang.get('bar')} {bar}:{beat}"
+        return f"{position}, {lang.get('lint_' + rule)}{' ' + text if text else ''}"
+
+    def go_to_finding(self, position):
+        """Jump to a problem of the last lyric check, wrapping around at both ends"""
+        if not self.lint_findings:
+            self.output.speak(lang.get('no_lint'), interrupt=True)
+            return
+        
+        self.lint_position = position % len(self.lint_findings)
+        finding = self.lint_findings[self.lint_position]
+        pair_index, note_index = finding[0], finding[1]
+        if pair_index != self.current_pair:
+            self.select_pair(pair_index)
+        self.current_note_index = note_index
+        self.update_displays()
+        self.output.speak(f"{lang.get('problem')} {self.lint_position + 1} {lang.get('of')} {len(self.lint_findings)}: {self.describe_finding(finding)}", interrupt=True)
 
-    def on_toggle_auto_announce(self, event):
-        self.auto_announce_lyrics = not self.auto_announce_lyrics
-        status = lang.get('auto_announce_on') if self.auto_announce_lyrics else lang.get('auto_announce_off')
-        self.output.speak(status, interrupt=True)
-        self.update_status_display()
+    def get_file_state(self):
+        """The state of the current file kept by the workspace, containers are copied so later changes stay apart"""
+        self.pair_positions[self.current_pair] = self.current_note_index
+        return {
+            'analysis': self.analysis,
+            'track_pairs': list(self.track_pairs),
+            'track_properties': dict(self.track_properties),
+            'pair_positions': dict(self.pair_positions),
+            'current_pair': self.current_pair,
+            'notes': list(self.notes),
+            'timed_lyrics': list(self.timed_lyrics),
+            'lyric_models': list(self.lyric_models),
+            'search_index': self.search_index,
+            'bar_indexes': list(self.bar_indexes),
+            'pair_statistics': list(self.pair_statistics),
+            'tempo_map': self.tempo_map,
+        }
 
-    def on_track_select(self, event):
-        self.current_pair = event.GetSelection()
-        self.current_note_index = 0
+    def switch_to_file(self, path):
+        """Go back to a file of the workspace with its pairs and positions, without reloading it"""
+        if self.current_file:
+            self.workspace.put(self.current_file, self.get_file_state())
+        state = self.workspace.get(path)
+        if state is None:
+            # Closed to stay in the memory budget
+            self.load_midi(path)
+            return
+        
+        self.player.stop()
+        self.stop_preview()
+        for name, value in state.items():
+            setattr(self, name, value)
+        self.midi_data = self.analysis.midi_data
+        self.current_file = path
+        self.save_file_analysis()
+        self.clear_loop()
+        self.diff_changes = []
+        self.lint_findings = []
+        self.prepare_playback_plan()
         self.last_announced_lyric = None
+        
+        self.update_track_list()
+        if self.track_pairs:
+            self.current_note_index = self.pair_positions.get(self.current_pair, 0)
+            self.track_list.SetSelection(self.current_pair)
+            self.apply_track_properties()
         self.update_displays()
+        self.output.speak(os.path.basename(path), interrupt=True)
+
+    def select_pair(self, pair_index):
+        # Each pair comes back to the note it was left on
+        self.pair_positions[self.current_pair] = self.current_note_index
+        self.track_list.SetSelection(pair_index)
+        self.current_pair = pair_index
+        self.current_note_index = self.pair_positions.get(pair_index, 0)
+        self.clear_loop()
+        self.prepare_playback_plan()
+        self.last_announced_lyric = None
         self.apply_track_properties()
 
+    def on_track_select(self, event):
+        self.select_pair(event.GetSelection())
+        self.update_displays()
+
     def on_quit(self, event):
         self.Close()
 
     def on_close(self, event):
-        self.playing = False
-        if self.output_port:
-            self.output_port.close()
+        self.player.stop()
+        self.save_session()
+        self.session.flush()
+        self.session.wait_for_analysis()
+        self.output.stop()
+        self.port_manager.close_all()
+        if self.folder_watcher:
+            self.folder_watcher.stop()
         self.Destroy()
 
     # Core functionality
+    def save_session(self):
+        self.session.update(
+            metronome={'enabled': self.metronome_enabled,
+                       'downbeat_note': self.downbeat_note, 'upbeat_note': self.upbeat_note},
+            language=lang.current_language,
+            auto_announce=self.auto_announce_lyrics,
+            announce_lead_ms=self.announce_lead_ms,
+            speed=self.playback_speed,
+            workspace_mb=self.workspace.budget_mb,
+            split_channels=self.split_channels,
+        )
+        if not self.current_file:
+            return
+        self.pair_positions[self.current_pair] = self.current_note_index
+        self.session.update(
+            file=self.current_file,
+            pairs=[list(pair) for pair in self.track_pairs],
+            properties=[self.track_properties.get(i) for i in range(len(self.track_pairs))],
+            positions=[self.pair_positions.get(i, 0) for i in range(len(self.track_pairs))],
+            current_pair=self.current_pair,
+        )
+
+    def save_file_analysis(self):
+        """Keep the analysis of the current file for the next session, written in the background"""
+        try:
+            stamp = self.analysis_cache.file_stamp(self.current_file)
+        except OSError:
+            return
+        self.session.save_analysis(self.current_file, stamp, self.analysis)
+
+    def restore_session(self):
+        """Reopen the file of the last session with its pairs, properties, settings and positions"""
+        data = dict(self.session.load())
+        metronome = data.get('metronome', {})
+        self.metronome_enabled = metronome.get('enabled', self.metronome_enabled)
+        self.downbeat_note = metronome.get('downbeat_note', self.downbeat_note)
+        self.upbeat_note = metronome.get('upbeat_note', self.upbeat_note)
+        self.auto_announce_lyrics = data.get('auto_announce', self.auto_announce_lyrics)
+        self.announce_lead_ms = data.get('announce_lead_ms', self.announce_lead_ms)
+        self.playback_speed = data.get('speed', self.playback_speed)
+        self.workspace.budget_mb = data.get('workspace_mb', self.workspace.budget_mb)
+        self.split_channels = data.get('split_channels', self.split_channels)
+        if data.get('language', lang.current_language) != lang.current_language:
+            lang.set_language(data['language'])
+            self.update_interface_language()
+        
+        path = data.get('file')
+        if not path:
+            return
+        try:
+            stamp = self.analysis_cache.file_stamp(path)
+            # The pickled analysis is only valid for the same version of the same file
+            analysis = self.session.load_analysis(path, stamp)
+            if analysis is not None:
+                self.analysis_cache.put(path, stamp, analysis)
+            self.analysis = self.get_analysis(path)
+        except Exception:
+            return
+        self.midi_data = self.analysis.midi_data
+        
+        pairs = [tuple(pair) for pair in data.get('pairs', [])]
+        if not pairs or not self.pairs_fit(self.analysis, pairs):
+            # The file has changed too much, pairs have to be chosen again
+            self.load_midi(path)
+            return
+        
+        self.track_pairs = pairs
+        self.track_properties = {i: props for i, props in enumerate(data.get('properties', [])) if props}
+        self.set_track_pairs(pairs)
+        self.pair_positions = {i: min(position, max(len(self.notes[i]) - 1, 0))
+                               for i, position in enumerate(data.get('positions', [])) if i < len(pairs)}
+        self.current_file = path
+        self.update_track_list()
+        
+        self.current_pair = min(data.get('current_pair', 0), len(pairs) - 1)
+        self.current_note_index = self.pair_positions.get(self.current_pair, 0)
+        self.track_list.SetSelection(self.current_pair)
+        self.apply_track_properties()
+        self.update_displays()
+        self.workspace.put(path, self.get_file_state())
+        self.output.speak(f"{lang.get('session_restored')} {os.path.basename(path)}", interrupt=True)
+
+    def get_analysis(self, path):
+        # Files already analyzed, for example by the folder watcher, open at once
+        cached = self.analysis_cache.get(path)
+        if cached:
+            return cached[0]
+        # Load MIDI data completely into RAM
+        stamp = self.analysis_cache.file_stamp(path)
+        with open(path, 'rb') as f:
+            analysis = read_midi_analysis(f.read())
+        self.analysis_cache.put(path, stamp, analysis)
+        return analysis
+
+    def create_pairing_dialog(self, analysis):
+        return TrackPairingDialog(self, analysis.get_track_info(), analysis.get_voice_info(), self.split_channels)
+
     def load_midi(self, path):
         try:
-            # Load MIDI data completely into RAM
-            self.midi_data = copy.deepcopy(MidiFile(path))
-            
-            # Analyze tracks
-            track_info = []
-            for i, track in enumerate(self.midi_data.tracks):
-                name = f"{lang.get('track')} {i + 1}"
-                for msg in track:
-                    if msg.type == 'track_name':
-                        name = f"{lang.get('track')} {i + 1}: {msg.name.strip()}"
-                        break
-                
-                has_notes, has_lyrics = self.analyze_track_content(track)
-                track_info.append((name, has_notes, has_lyrics))
+            analysis = self.get_analysis(path)
             
             # Always show the track pairing dialog
-            dlg = TrackPairingDialog(self, track_info)
+            dlg = self.create_pairing_dialog(analysis)
             if dlg.ShowModal() == wx.ID_OK:
-                self.track_pairs = dlg.get_track_pairs()
-                self.process_tracks()
+                self.split_channels = dlg.get_split_channels()
+                # The current file stays open in the workspace
+                if self.current_file:
+                    self.workspace.put(self.current_file, self.get_file_state())
+                self.analysis = analysis
+                # The track list comes from a scan of the file, its messages are parsed now
+                self.midi_data = self.analysis.midi_data
+                # Properties and positions belong to the pairs of the previous file
+                self.track_pairs = []
+                self.track_properties.clear()
+                self.pair_positions = {}
+                self.current_pair = 0
+                self.current_note_index = 0
+                self.set_track_pairs(dlg.get_track_pairs())
+                self.current_file = path
+                self.save_file_analysis()
+                self.save_session()
                 self.update_track_list()
                 
                 total_notes = sum(len(notes) for notes in self.notes)
@@ -1002,12 +3798,11 @@ class MidiLyricChecker(wx.Frame):
                     self.current_note_index = 0
                     self.last_announced_lyric = None
                     self.update_displays()
+                self.workspace.put(path, self.get_file_state())
                     
                 # Auto-select MIDI device after successful load
                 wx.CallAfter(self.ensure_midi_auto_select)
-            else:
-                # User cancelled, clear data
-                self.midi_data = None
+            # If the user cancelled, the current file stays loaded
             dlg.Destroy()
                 
         except Exception as e:
@@ -1015,6 +3810,9 @@ class MidiLyricChecker(wx.Frame):
 
     def ensure_midi_auto_select(self):
         """Ensure MIDI device is selected after loading a file"""
+        # Enumeration still running, it selects a device itself when done
+        if not self.port_manager.enumerated.is_set():
+            return
         if not self.output_port and MIDI_AVAILABLE:
             if not self.auto_select_default_midi():
                 # No device could be auto-selected
@@ -1024,163 +3822,115 @@ class MidiLyricChecker(wx.Frame):
                     wx.OK | wx.ICON_INFORMATION
                 )
 
-    def analyze_track_content(self, track):
-        has_notes = False
-        has_lyrics = False
-        
-        for msg in track:
-            # Check for notes
-            if msg.type == 'note_on' and msg.velocity > 0:
-                has_notes = True
-                
-            # Check for lyrics - be very broad in detection
-            elif (msg.type in ['lyrics', 'text', 'marker', 'cue_marker'] or 
-                  hasattr(msg, 'text') or 
-                  hasattr(msg, 'data')):
-                
-                text_content = ""
-                if hasattr(msg, 'text') and msg.text:
-                    text_content = str(msg.text).strip()
-                elif hasattr(msg, 'data') and msg.data:
-                    try:
-                        if isinstance(msg.data, bytes):
-                            text_content = msg.data.decode('utf-8', errors='ignore').strip()
-                        else:
-                            text_content = str(msg.data).strip()
-                    except:
-                        pass
-                
-                if text_content and len(text_content) > 0:
-                    has_lyrics = True
-        
-        return has_notes, has_lyrics
-
-    def process_tracks(self):
-        self.notes.clear()
-        self.timed_lyrics.clear()
+    def set_track_pairs(self, track_pairs):
+        """Replace the track pairs, keeping track properties and positions attached to the same pairs"""
+        self.pair_positions[self.current_pair] = self.current_note_index
+        pair_properties = {}
+        for i, pair in enumerate(self.track_pairs):
+            if i in self.track_properties:
+                pair_properties.setdefault(pair, self.track_properties[i])
         
-        for notes_track_idx, lyrics_track_idx in self.track_pairs:
-            # Process notes track
-            if notes_track_idx < len(self.midi_data.tracks):
-                track_notes = self.extract_notes_from_track(self.midi_data.tracks[notes_track_idx])
-                self.notes.append(track_notes)
-            else:
-                self.notes.append([])
-            
-            # Process lyrics track
-            if lyrics_track_idx is not None and lyrics_track_idx < len(self.midi_data.tracks):
-                track_lyrics = self.extract_lyrics_from_track(self.midi_data.tracks[lyrics_track_idx])
-                self.timed_lyrics.append(track_lyrics)
-            else:
-                self.timed_lyrics.append([])
-
-    def extract_notes_from_track(self, track):
-        abs_time = 0
-        track_notes = []
+        pair_positions = {}
+        for i, pair in enumerate(self.track_pairs):
+            if i in self.pair_positions:
+                pair_positions.setdefault(pair, self.pair_positions[i])
         
-        for msg in track:
-            abs_time += msg.time
-            if msg.type == 'note_on' and msg.velocity > 0:
-                track_notes.append((abs_time, msg.note, getattr(msg, 'channel', 0)))
+        self.track_properties = {}
+        self.pair_positions = {}
+        for i, pair in enumerate(track_pairs):
+            if pair in pair_properties:
+                self.track_properties[i] = pair_properties[pair]
+            if pair in pair_positions:
+                self.pair_positions[i] = pair_positions[pair]
         
-        return track_notes
+        self.track_pairs = track_pairs
+        self.clear_loop()
+        self.diff_changes = []
+        self.lint_findings = []
+        self.process_tracks()
 
-    def extract_lyrics_from_track(self, track):
-        abs_time = 0
-        track_lyrics = []
-        
-        for msg in track:
-            abs_time += msg.time
-            
-            # Check for standard lyric types
-            if msg.type in ['lyrics', 'text', 'marker', 'cue_marker']:
-                if hasattr(msg, 'text'):
-                    lyric_text = msg.text.strip() if msg.text else ""
-                    if lyric_text and lyric_text not in ['/', '\\', '-', '']:
-                        track_lyrics.append((abs_time, lyric_text))
-                        
-            # Check for any message with text attribute
-            elif hasattr(msg, 'text') and msg.text:
-                lyric_text = msg.text.strip()
-                if lyric_text and lyric_text not in ['/', '\\', '-', '']:
-                    track_lyrics.append((abs_time, lyric_text))
-                    
-            # Check for data attribute (some MIDI files store lyrics differently)
-            elif hasattr(msg, 'data'):
-                try:
-                    if isinstance(msg.data, bytes):
-                        lyric_text = msg.data.decode('utf-8', errors='ignore').strip()
-                    else:
-                        lyric_text = str(msg.data).strip()
-                    if lyric_text and lyric_text not in ['/', '\\', '-', '']:
-                        track_lyrics.append((abs_time, lyric_text))
-                except:
-                    pass
+    def process_tracks(self):
+        # Extraction is memoized per source track, pairs only reference the results
+        self.notes = [self.analysis.get_notes(notes_track_idx) for notes_track_idx, _ in self.track_pairs]
+        self.timed_lyrics = [self.analysis.get_lyrics(lyrics_track_idx) for _, lyrics_track_idx in self.track_pairs]
+        self.lyric_models = [self.analysis.get_lyric_model(lyrics_track_idx) for _, lyrics_track_idx in self.track_pairs]
+        self.search_index = LyricSearchIndex(self.notes, self.lyric_models)
         
-        return track_lyrics
+        time_signatures, tempo_changes = self.get_time_signature_and_tempo()
+        self.tempo_map = TempoMap(self.midi_data.ticks_per_beat, tempo_changes)
+        self.bar_indexes = [BarIndex(time_signatures, self.midi_data.ticks_per_beat, [note[0] for note in notes]) for notes in self.notes]
+        tolerance = self.midi_data.ticks_per_beat // 8
+        self.pair_statistics = [build_pair_statistics(notes, lyrics, self.midi_data.ticks_per_beat, tolerance)
+                                for notes, lyrics in zip(self.notes, self.timed_lyrics)]
+        self.prepare_playback_plan()
 
     def update_track_list(self):
         track_names = []
         for i, (notes_track_idx, lyrics_track_idx) in enumerate(self.track_pairs):
-            lyrics_name = f"{lyrics_track_idx + 1}" if lyrics_track_idx is not None else lang.get('none')
-            track_names.append(f"{lang.get('pair_prefix')} {i + 1}: {lang.get('notes_prefix')} {notes_track_idx + 1}, {lang.get('lyrics_prefix')} {lyrics_name}")
+            lyrics_name = self.analysis.get_source_number(lyrics_track_idx) if lyrics_track_idx is not None else lang.get('none')
+            track_names.append(f"{lang.get('pair_prefix')} {i + 1}: {lang.get('notes_prefix')} {self.analysis.get_source_number(notes_track_idx)}, {lang.get('lyrics_prefix')} {lyrics_name}")
         
         self.track_list.Set(track_names)
 
+    def show_lyric_message(self, text):
+        self.lyric_display.SetValue(text)
+        self.rendered_lyrics = None
+
+    def lyric_window_contains(self, model, row):
+        """Whether row is in the rendered window, away from an edge that has more lyrics past it"""
+        first_row, end_row = self.lyric_window
+        if row < first_row or row >= end_row:
+            return False
+        if first_row > 0 and row < first_row + LYRIC_WINDOW_MARGIN:
+            return False
+        if end_row < len(model.rows) and row >= end_row - LYRIC_WINDOW_MARGIN:
+            return False
+        return True
+
     def update_lyric_display(self):
         if not self.notes or self.current_pair >= len(self.notes):
-            self.lyric_display.SetValue(lang.get('no_track_pair'))
+            self.show_lyric_message(lang.get('no_track_pair'))
             return False
             
         notes = self.notes[self.current_pair]
-        lyrics = self.get_current_lyrics()
+        model = self.lyric_models[self.current_pair]
         
         if not notes:
-            current_lyric = " ".join([lyric[1] for lyric in lyrics]) if lyrics else lang.get('no_notes_track')
             self.current_single_lyric = None
-            self.lyric_display.SetValue(current_lyric)
+            self.show_lyric_message(model.text if model.syllables else lang.get('no_notes_track'))
             return False
         
-        if not lyrics:
-            self.lyric_display.SetValue(lang.get('no_lyrics_found'))
+        if not model.syllables:
+            self.show_lyric_message(lang.get('no_lyrics_found'))
             self.current_single_lyric = None
             return False
         
-        # Display all lyrics
-        current_lyric = " ".join([lyric[1] for lyric in lyrics])
-        self.lyric_display.SetValue(current_lyric)
-        
         # Find current lyric based on note timing
-        current_note_time = notes[self.current_note_index][0]
-        current_position = -1
+        current_position = model.syllable_at(notes[self.current_note_index][0])
         
-        for i, (lyric_time, lyric_text) in enumerate(lyrics):
-            if lyric_time <= current_note_time:
-                current_position = i
-            else:
-                break
+        # Only a window of lines around the current one is in the control. It is sent again
+        # when the position gets near its edges, otherwise moving only changes the highlight
+        row, start_column, end_column = model.syllable_positions[max(current_position, 0)]
+        if self.rendered_lyrics is not model or not self.lyric_window_contains(model, row):
+            self.lyric_window = model.window_around(max(current_position, 0), LYRIC_WINDOW_ROWS)
+            self.lyric_display.SetValue('\n'.join(model.rows[self.lyric_window[0]:self.lyric_window[1]]))
+            self.rendered_lyrics = model
         
         if current_position >= 0:
-            self.current_single_lyric = lyrics[current_position][1]
+            self.current_single_lyric = model.syllables[current_position][1]
             # Highlight current lyric
             try:
-                start_pos = sum(len(lyrics[i][1]) + 1 for i in range(current_position))
-                end_pos = start_pos + len(lyrics[current_position][1])
+                row -= self.lyric_window[0]
+                start_pos = self.lyric_display.XYToPosition(start_column, row)
+                end_pos = self.lyric_display.XYToPosition(end_column, row)
                 self.lyric_display.SetSelection(start_pos, end_pos)
                 self.lyric_display.ShowPosition(start_pos)
             except:
                 pass  # If highlighting fails, continue without it
             return True
         else:
-            # No lyric yet, find the most recent one
-            if lyrics:
-                recent_lyrics = [lyric for lyric in lyrics if lyric[0] <= current_note_time]
-                if recent_lyrics:
-                    self.current_single_lyric = recent_lyrics[-1][1]
-                else:
-                    self.current_single_lyric = lyrics[0][1]  # Use first lyric if none match
-            else:
-                self.current_single_lyric = None
+            # No lyric yet, use the first one
+            self.current_single_lyric = model.syllables[0][1]
         
         return False
 
@@ -1202,18 +3952,42 @@ class MidiLyricChecker(wx.Frame):
             return
         
         status_text = f"{lang.get('note')} {self.current_note_index + 1}/{len(notes)}\n"
+        chord = notes[self.current_note_index][1]
+        if len(chord) > 1:
+            status_text += f"{lang.get('chord_notes')} {len(chord)}\n"
+        if self.current_pair < len(self.bar_indexes):
+            bar, beat = self.bar_indexes[self.current_pair].bar_beat(self.current_note_index)
+            status_text += f"{lang.get('bar')} {bar}:{beat}\n"
         status_text += f"{lang.get('pair_prefix')} {self.current_pair + 1}/{len(self.track_pairs)}\n"
         
         # Show track pair info
         if self.current_pair < len(self.track_pairs):
             notes_track, lyrics_track = self.track_pairs[self.current_pair]
-            status_text += f"{lang.get('notes')}: {lang.get('track')} {notes_track + 1}\n"
-            status_text += f"{lang.get('lyrics')}: {lang.get('track')} {lyrics_track + 1 if lyrics_track is not None else lang.get('none')}\n"
+            status_text += f"{lang.get('notes')}: {lang.get('track')} {self.analysis.get_source_number(notes_track)}\n"
+            status_text += f"{lang.get('lyrics')}: {lang.get('track')} {self.analysis.get_source_number(lyrics_track) if lyrics_track is not None else lang.get('none')}\n"
         
         status_text += f"{lang.get('lyrics_in_pair')} {len(lyrics)}\n"
+        title = self.lyric_models[self.current_pair].get_title() if self.current_pair < len(self.lyric_models) else None
+        if title:
+            status_text += f"{lang.get('song_title')} {title}\n"
         status_text += f"{lang.get('midi_status')} {lang.get('yes') if MIDI_AVAILABLE and self.output_port else lang.get('no')}\n"
         status_text += f"{lang.get('metronome')}: {lang.get('on') if self.metronome_enabled else lang.get('off')}\n"
-        status_text += f"{lang.get('auto_announce')}: {lang.get('on') if self.auto_announce_lyrics else lang.get('off')}"
+        status_text += f"{lang.get('speed')}: {round(self.playback_speed * 100)}%\n"
+        status_text += f"{lang.get('auto_announce')}: {lang.get('on') if self.auto_announce_lyrics else lang.get('off')}\n"
+        if self.loop_start is not None or self.loop_end is not None:
+            loop_marks = [str(mark + 1) if mark is not None else '?' for mark in (self.loop_start, self.loop_end)]
+            status_text += f"{lang.get('loop')}: {'-'.join(loop_marks)} {lang.get('on') if self.loop_enabled else lang.get('off')}\n"
+        
+        events, mean_lateness, worst_lateness = self.lateness.get_stats()
+        if events:
+            status_text += f"{lang.get('timer_stats')} {self.timer.name}, {mean_lateness * 1000:.1f}/{worst_lateness * 1000:.1f} ms\n"
+        
+        if self.show_statistics:
+            if self.current_pair < len(self.pair_statistics):
+                status_text += '\n'.join(self.describe_statistics(self.pair_statistics[self.current_pair])) + '\n'
+            # Diagnostics of the speech queue, only on request so each note step reads cleanly
+            dropped, delayed, failed = self.output.get_stats()
+            status_text += f"{lang.get('speech_stats')} {dropped}/{delayed}/{failed}\n"
         
         self.status_display.SetValue(status_text)
 
@@ -1228,238 +4002,571 @@ class MidiLyricChecker(wx.Frame):
             except:
                 pass
 
-    def play_note(self, note, channel=0):
-        if MIDI_AVAILABLE and self.output_port:
-            try:
-            # Send all notes off first to stop any previous notes
-                self.output_port.send(Message('control_change', channel=channel, control=123, value=0))
-            # Play the note
-                self.output_port.send(Message('note_on', note=note, velocity=100, channel=channel))
-            # For single note preview, still use the short duration
-                time.sleep(0.1)
-                self.output_port.send(Message('note_off', note=note, velocity=100, channel=channel))
-            except:
-                pass    
-    def play_metronome_beat(self, is_downbeat=True):
-        if MIDI_AVAILABLE and self.output_port and self.metronome_enabled:
-            try:
-                note = self.downbeat_note if is_downbeat else self.upbeat_note
-                self.output_port.send(Message('note_on', note=note, velocity=127, channel=9))
-                time.sleep(0.1)
-                self.output_port.send(Message('note_off', note=note, velocity=127, channel=9))
-            except:
-                pass
-    
-    def start_metronome(self, tempo, time_sig_num=4, start_time=None):
-        """Start synchronized metronome thread"""
-        def _metronome():
-            beat_interval = 60.0 / tempo  # Seconds per beat
-            
-            # Wait for start_time if provided
-            if start_time:
-                while time.time() < start_time and self.playing:
-                    time.sleep(0.01)
-            
-            metronome_start = start_time if start_time else time.time()
-            beat_count = 0
-            
-            while self.playing and self.metronome_enabled:
-                current_time = time.time()
-                elapsed_time = current_time - metronome_start
-                expected_beat_time = beat_count * beat_interval
-                
-                # If we're ahead of schedule, wait
-                if elapsed_time < expected_beat_time:
-                    sleep_time = expected_beat_time - elapsed_time
-                    while sleep_time > 0 and self.playing and self.metronome_enabled:
-                        chunk = min(sleep_time, 0.01)  # Check every 10ms
-                        time.sleep(chunk)
-                        sleep_time -= chunk
-                        current_time = time.time()
-                        elapsed_time = current_time - metronome_start
-                
-                # Play the beat if we're still playing
-                if self.playing and self.metronome_enabled:
-                    is_downbeat = (beat_count % time_sig_num == 0)
-                    self.play_metronome_beat(is_downbeat)
-                    beat_count += 1
+    def play_chord(self, tick, chord, channel=None):
+        """Preview the notes of an onset group for their real duration at the playback speed.
+        channel overrides the channel of the notes when set."""
+        self.stop_preview()
         
-        if self.metronome_enabled:
-            self.metronome_thread = threading.Thread(target=_metronome, daemon=True)
-            self.metronome_thread.start()
+        start_seconds = self.tempo_map.tick_to_seconds(tick)
+        releases = []  # (seconds after the start, channel, note)
+        with self.preview_lock:
+            for note, note_channel, duration, velocity in chord:
+                note_channel = note_channel if channel is None else channel
+                try:
+                    self.output_port.send(Message('note_on', note=note, velocity=velocity, channel=note_channel))
+                except Exception:
+                    pass
+                release = (self.tempo_map.tick_to_seconds(tick + duration) - start_seconds) / self.playback_speed
+                # Notes without a length still sound briefly
+                releases.append((max(release, 0.1), note_channel, note))
+            releases.sort()
+            self.preview_releases = releases
+        
+        threading.Thread(target=self._release_preview, args=(releases, time.time()), daemon=True).start()
+
+    def _release_preview(self, releases, started):
+        while True:
+            with self.preview_lock:
+                # Replaced or stopped previews were already released by stop_preview
+                if self.preview_releases is not releases or not releases:
+                    return
+                release, channel, note = releases[0]
+                remaining = started + release - time.time()
+                if remaining <= 0:
+                    releases.pop(0)
+                    try:
+                        self.output_port.send(Message('note_off', note=note, velocity=0, channel=channel))
+                    except Exception:
+                        pass
+                    continue
+            time.sleep(min(remaining, 0.05))
+
+    def stop_preview(self):
+        """Release the notes of the last preview at once"""
+        with self.preview_lock:
+            releases, self.preview_releases = self.preview_releases, []
+            for _, channel, note in releases:
+                try:
+                    self.output_port.send(Message('note_off', note=note, velocity=0, channel=channel))
+                except Exception:
+                    pass
 
     def get_time_signature_and_tempo(self):
         """Extract time signature and tempo changes from MIDI file"""
-        time_signatures = []
-        tempo_changes = []
+        return self.analysis.get_time_signature_and_tempo()
+
+    def build_pair_events(self, pair_index, start_tick=0, setup=True):
+        """Build the playback events of a pair, shared by live playback and export"""
+        notes_track_idx, lyrics_track_idx = self.track_pairs[pair_index]
+        track = self.analysis.get_track(notes_track_idx)
+        lyrics = self.timed_lyrics[pair_index] if pair_index < len(self.timed_lyrics) else []
         
-        for track in self.midi_data.tracks:
-            accumulated_time = 0
-            for msg in track:
-                accumulated_time += msg.time
-                
-                if msg.type == 'time_signature':
-                    # MIDI time signature: numerator/denominator, clocks_per_click, notated_32nd_notes_per_beat
-                    time_signatures.append((accumulated_time, msg.numerator, msg.denominator))
-                
-                elif msg.type == 'set_tempo':
-                    # Convert microseconds per beat to BPM
-                    bpm = 60000000 / msg.tempo
-                    tempo_changes.append((accumulated_time, bpm))
+        # The metronome grid covers the whole pair
+        end_tick = sum(msg.time for msg in track)
+        if lyrics:
+            end_tick = max(end_tick, lyrics[-1][0])
+        time_signatures, _ = self.get_time_signature_and_tempo()
+        grid = build_metronome_grid(time_signatures, self.midi_data.ticks_per_beat, end_tick)
         
-        # Set defaults if not found
-        if not time_signatures:
-            time_signatures = [(0, 4, 4)]  # Default 4/4 time
-        if not tempo_changes:
-            tempo_changes = [(0, 120)]  # Default 120 BPM
+        return build_playback_events(track, lyrics, self.track_properties.get(pair_index), grid,
+                                     (self.downbeat_note, self.upbeat_note), start_tick, setup)
+
+    def get_playback_plan(self, pair_index):
+        """Get the playback plan of a pair, building it on first use. Plans are cached by file,
+        pair, track properties and metronome notes, so any change of these builds a new one."""
+        properties = self.track_properties.get(pair_index)
+        key = (self.analysis, self.track_pairs[pair_index],
+               tuple(sorted(properties.items())) if properties else None, (self.downbeat_note, self.upbeat_note))
+        with self.plan_lock:
+            if key in self.plan_cache:
+                self.plan_cache.move_to_end(key)
+                return self.plan_cache[key]
+        
+        plan = PlaybackPlan(self.build_pair_events(pair_index, 0, setup=False), properties, self.tempo_map)
+        with self.plan_lock:
+            self.plan_cache[key] = plan
+            while len(self.plan_cache) > PLAN_CACHE_SIZE:
+                self.plan_cache.popitem(last=False)
+        return plan
+
+    def drop_playback_plans(self, analysis):
+        """Forget the plans built from an analysis that was released"""
+        with self.plan_lock:
+            for key in [key for key in self.plan_cache if key[0] is analysis]:
+                del self.plan_cache[key]
+
+    def prepare_playback_plan(self):
+        """Build the plan of the current pair in the background, so pressing play starts at once"""
+        if self.analysis is None or self.current_pair >= len(self.track_pairs):
+            return
+        threading.Thread(target=self.get_playback_plan, args=(self.current_pair,), daemon=True).start()
+
+    def export_pairs(self, path, pair_indices, synth=None):
+        """Export pairs faster than real time to a Standard MIDI File, or to WAV through synth"""
+        _, tempo_changes = self.get_time_signature_and_tempo()
+        pair_events = [(i, self.build_pair_events(i)) for i in pair_indices]
+        
+        if path.lower().endswith('.wav'):
+            tempo_map = TempoMap(self.midi_data.ticks_per_beat, tempo_changes)
+            timed_messages = []
+            for n, (_, events) in enumerate(pair_events):
+                for tick, kind, payload in events:
+                    # Clicks are the same in every pair, take them once
+                    if kind == 'message' or (kind == 'click' and n == 0 and self.metronome_enabled):
+                        timed_messages.append((tempo_map.tick_to_seconds(tick), payload))
+            timed_messages.sort(key=lambda item: item[0])
             
-        return time_signatures, tempo_changes
-
-    def get_current_time_signature(self, current_tick, time_signatures):
-        """Get the current time signature based on current position"""
-        current_sig = (4, 4)  # Default
-        for tick, numerator, denominator in time_signatures:
-            if tick <= current_tick:
-                current_sig = (numerator, denominator)
-            else:
-                break
-        return current_sig
+            synth = synth or SineSynth()
+            samples = synth.render(timed_messages)
+            if sys.byteorder == 'big':
+                samples.byteswap()
+            with wave.open(path, 'wb') as wav:
+                wav.setnchannels(1)
+                wav.setsampwidth(2)
+                wav.setframerate(synth.sample_rate)
+                wav.writeframes(samples.tobytes())
+            return
+        
+        time_signatures, _ = self.get_time_signature_and_tempo()
+        export = MidiFile(ticks_per_beat=self.midi_data.ticks_per_beat)
+        
+        # Conductor track with the tempo map of the file
+        conductor = [(tick, MetaMessage('set_tempo', tempo=bpm2tempo(bpm))) for tick, bpm in tempo_changes]
+        conductor += [(tick, MetaMessage('time_signature', numerator=num, denominator=den)) for tick, num, den in time_signatures]
+        export.tracks.append(self.to_midi_track(conductor))
+        
+        for pair_index, events in pair_events:
+            # Lyrics are written back in the encoding they were read with
+            encoding = self.analysis.get_text_encoding(self.track_pairs[pair_index][1])
+            timed_messages = [(0, MetaMessage('track_name', name=f"{lang.get('pair_prefix')} {pair_index + 1}"))]
+            for tick, kind, payload in events:
+                if kind == 'message':
+                    timed_messages.append((tick, payload))
+                elif kind == 'lyric':
+                    text = payload.encode(encoding, errors='replace').decode('latin-1')
+                    timed_messages.append((tick, MetaMessage('lyrics', text=text)))
+            export.tracks.append(self.to_midi_track(timed_messages))
+        
+        if self.metronome_enabled and pair_events:
+            clicks = [(0, MetaMessage('track_name', name=lang.get('metronome_track')))]
+            clicks += [(tick, payload) for tick, kind, payload in pair_events[0][1] if kind == 'click']
+            export.tracks.append(self.to_midi_track(clicks))
+        
+        export.save(path)
 
-    def get_current_tempo(self, current_tick, tempo_changes):
-        """Get the current tempo based on current position"""
-        current_tempo = 120  # Default
-        for tick, bpm in tempo_changes:
-            if tick <= current_tick:
-                current_tempo = bpm
+    def to_midi_track(self, timed_messages):
+        """Convert (absolute tick, message) pairs to a track with delta times"""
+        track = MidiTrack()
+        last_tick = 0
+        for tick, msg in sorted(timed_messages, key=lambda item: item[0]):
+            track.append(msg.copy(time=tick - last_tick))
+            last_tick = tick
+        return track
+
+    def calibrate_timer(self):
+        """Pick the most accurate timer of this system, run once in the background at startup"""
+        self.timer, self.timer_measurements = choose_timer()
+        # Waits that can be stopped overshoot like the event timer, the timer takes over early enough
+        event_overshoot = self.timer_measurements.get('event', (0.0, 0.0))[0]
+        self.fine_wait = max(TIMER_FINE_WAIT, 2 * event_overshoot)
+
+    def send_output(self, msg):
+        if MIDI_AVAILABLE and self.output_port:
+            self.output_port.send(msg)
+
+    def wait_until(self, deadline):
+        """Sleep until deadline on the playback clock, returns False if playback stopped.
+        Stopping cuts the wait short at once, except during its last few milliseconds."""
+        while self.player.is_playing():
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                return True
+            if remaining > self.fine_wait:
+                self.player.wait(remaining - self.fine_wait)
             else:
-                break
-        return current_tempo
+                self.timer.sleep_until(deadline)
+        return False
+
+    def wait_for(self, clock, song_seconds):
+        """Sleep until the playback clock reaches song_seconds, following speed changes.
+        Returns False if playback stopped"""
+        while True:
+            if clock.speed != self.playback_speed:
+                clock.set_speed(self.playback_speed)
+            deadline = clock.deadline(song_seconds)
+            now = time.perf_counter()
+            if now >= deadline:
+                # Events due before playback started, such as early lyrics, are not late
+                self.lateness.add(max(0.0, now - max(deadline, clock.start)))
+                return True
+            # Wake up at least every 50ms to pick up speed changes
+            if not self.wait_until(min(deadline, now + 0.05)):
+                return False
 
     def play_current_track(self):
         def _play():
-            self.playing = True
-            
             if not self.midi_data or self.current_pair >= len(self.track_pairs):
-                self.playing = False
                 return
             
             notes_track_idx, _ = self.track_pairs[self.current_pair]
-            if notes_track_idx >= len(self.midi_data.tracks):
-                self.playing = False
+            if notes_track_idx >= self.analysis.get_source_count():
                 return
             
-            track = self.midi_data.tracks[notes_track_idx]
-            
-            # Get time signatures and tempo changes from the file
-            time_signatures, tempo_changes = self.get_time_signature_and_tempo()
-            
             # Get current position in the track
             current_tick = 0
             if self.current_note_index > 0 and self.current_note_index < len(self.notes[self.current_pair]):
                 current_tick = self.notes[self.current_pair][self.current_note_index][0]
             
-            # Find where we are in the actual MIDI track
-            accumulated_time = 0
-            start_message_index = 0
-            
-            for i, msg in enumerate(track):
-                accumulated_time += msg.time
-                if accumulated_time >= current_tick:
-                    start_message_index = i
-                    break
+            # The events of the pair on the playback clock, usually built in the background already
+            plan = self.get_playback_plan(self.current_pair)
+            tempo_map = plan.tempo_map
+            # Lyrics are issued ahead of their note to cover the screen reader latency
+            announce_lead = self.announce_lead_ms / 1000.0
             
-            # Get initial tempo and time signature for metronome
-            current_tempo = self.get_current_tempo(accumulated_time, tempo_changes)
-            time_sig_num, time_sig_den = self.get_current_time_signature(accumulated_time, time_signatures)
+            def _timeline(start_tick, end_tick=None):
+                return plan.timeline(start_tick, end_tick, announce_lead)
             
-            # Calculate synchronized start time (both threads start at same moment)
-            playback_start_time = time.time() + 0.1  # Small delay to ensure both threads sync
+            # Inside an A/B loop playback continues from the current note, elsewhere it starts at A
+            loop = self.get_loop_ticks()
+            loop_timeline = None
+            if loop:
+                if not loop[0] <= current_tick < loop[1]:
+                    current_tick = loop[0]
+                timeline = _timeline(current_tick, loop[1])
+                loop_timeline = timeline if current_tick == loop[0] else _timeline(loop[0], loop[1])
+            else:
+                timeline = _timeline(current_tick)
+            self.stop_preview()
             
-            # Start synchronized metronome
-            self.start_metronome(current_tempo, time_sig_num, playback_start_time)
+            note_ticks = [note[0] for note in self.notes[self.current_pair]]
             
-            # Wait until synchronized start time
-            while time.time() < playback_start_time and self.playing:
-                time.sleep(0.01)
+            # The plan is ready, only a short margin is left before the first event
+            clock = PlaybackClock(tempo_map.tick_to_seconds(current_tick), self.playback_speed, 0.01)
+            self.lateness.reset()
             
             # Play from current position
-            accumulated_time = 0
-            for i, msg in enumerate(track):
-                if i < start_message_index:
-                    accumulated_time += msg.time
-                    continue
+            while True:
+                for event_seconds, event_tick, kind, payload in timeline:
+                    if not self.wait_for(clock, event_seconds):
+                        break
                     
-                if not self.playing:
-                    break
-                
-                # Get current tempo for MIDI playback timing
-                current_tempo = self.get_current_tempo(accumulated_time, tempo_changes)
-                
-                # Sleep for the message timing
-                if msg.time > 0:
-                    sleep_time = (msg.time / self.midi_data.ticks_per_beat) * (60.0 / current_tempo)
+                    if kind == 'lyric':
+                        if self.auto_announce_lyrics:
+                            self.output.speak(payload, interrupt=True, droppable=True)
+                            self.last_announced_lyric = payload
+                        continue
                     
-                    # Only break into chunks if sleep time is significant (>100ms)
-                    if sleep_time > 0.1:
-                        while sleep_time > 0 and self.playing:
-                            chunk = min(sleep_time, 0.05)  # 50ms chunks
-                            time.sleep(chunk)
-                            sleep_time -= chunk
-                    else:
-                        time.sleep(sleep_time)
-                
-                if not self.playing:
-                    break
-                
-                accumulated_time += msg.time
-                
-                # Send the MIDI message
-                if MIDI_AVAILABLE and self.output_port:
-                    try:
-                        # Apply track properties if available
-                        if msg.type in ['note_on', 'note_off', 'program_change', 'control_change']:
-                            # Create a copy of the message with potentially modified channel
-                            msg_dict = msg.dict()
-                            if self.current_pair in self.track_properties:
-                                if 'channel' in msg_dict:
-                                    msg_dict['channel'] = self.track_properties[self.current_pair]['channel']
-                            
-                            modified_msg = Message(**msg_dict)
-                            self.output_port.send(modified_msg)
-                        else:
-                            # Send other messages as-is
-                            self.output_port.send(msg)
-                            
-                    except Exception as e:
-                        pass  # Continue playing even if individual messages fail
-                
-                # Update UI position for note_on messages
-                if msg.type == 'note_on' and msg.velocity > 0:
-                    # Find corresponding note index
-                    for note_idx, (note_time, note, channel) in enumerate(self.notes[self.current_pair]):
-                        if abs(note_time - accumulated_time) < self.midi_data.ticks_per_beat / 4:  # Within quarter beat
+                    msg = payload
+                    
+                    # Metronome can be toggled during playback, clicks already sounding are always released
+                    if kind == 'click' and not self.metronome_enabled and msg.type == 'note_on':
+                        continue
+                    
+                    # Send the MIDI message, the notes it leaves sounding are released when playback stops
+                    self.player.send_message(msg)
+                    
+                    # Update UI position for note_on messages
+                    if kind == 'message' and msg.type == 'note_on' and msg.velocity > 0:
+                        note_idx = bisect.bisect_right(note_ticks, event_tick) - 1
+                        if note_idx >= 0:
                             self.current_note_index = note_idx
                             if note_idx % 5 == 0:  # Update UI every 5 notes
                                 wx.CallAfter(self.update_displays)
-                                wx.CallAfter(self.announce_lyric_if_changed)
-                            break
-            
-            # Clean up - send all notes off
-            if MIDI_AVAILABLE and self.output_port:
-                try:
-                    for ch in range(16):
-                        self.output_port.send(Message('control_change', channel=ch, control=123, value=0))
-                except:
-                    pass
+                else:
+                    if not loop:
+                        break
+                    
+                    # Wrap from B to A exactly at the end of the loop, notes cut at B are released
+                    loop_end_seconds = tempo_map.tick_to_seconds(loop[1])
+                    if not self.wait_for(clock, loop_end_seconds):
+                        break
+                    self.player.release_notes()
+                    
+                    if self.loop_enabled:
+                        clock.jump(loop_end_seconds, tempo_map.tick_to_seconds(loop[0]))
+                        timeline = loop_timeline
+                    else:
+                        # Loop turned off during playback, go on past B
+                        timeline = _timeline(loop[1])
+                        loop = None
+                    continue
+                break
             
             wx.CallAfter(self.update_displays)
-            self.playing = False
 
-        self.play_thread = threading.Thread(target=_play, daemon=True)
-        self.play_thread.start()
+        # A playback still running is stopped and joined first
+        if not self.player.start(_play):
+            self.output.speak(lang.get('still_stopping'), interrupt=True)
+        
+# Longest request line the server reads, loads carry whole files as base64
+SERVER_LINE_LIMIT = 64 * 1024 * 1024
+# Memory of the loaded files, the least recently used ones are unloaded past it
+SERVER_BUDGET_MB = 256
+
+class LyricCheckerServer:
+    """Local JSON-RPC 2.0 server exposing the checker engine without the window.
+    Requests are one JSON object per line over TCP, and also WebSocket messages on
+    the next port when the websockets package is installed. Parsing runs in a
+    worker pool and loaded files are cached by the hash of their contents, under a
+    memory budget like the workspace of the window."""
+    def __init__(self, host='127.0.0.1', port=8765, workers=4, budget_mb=SERVER_BUDGET_MB):
+        self.host = host
+        self.port = port
+        self.budget_mb = budget_mb
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.files = OrderedDict()  # SHA-1 of the file -> MidiAnalysis, most recently used last
+        self.players = {}  # File id -> PlaybackController of its playback
+        self.port_manager = MidiPortManager()
+        self.methods = {
+            'load': self.rpc_load,
+            'unload': self.rpc_unload,
+            'tracks': self.rpc_tracks,
+            'suggest_pairs': self.rpc_suggest_pairs,
+            'notes': self.rpc_notes,
+            'lyrics': self.rpc_lyrics,
+            'report': self.rpc_report,
+            'ports': self.rpc_ports,
+            'play': self.rpc_play,
+            'stop': self.rpc_stop,
+        }
+
+    def run(self):
+        asyncio.run(self.serve())
+
+    async def serve(self):
+        server = await asyncio.start_server(self.handle_stream, self.host, self.port, limit=SERVER_LINE_LIMIT)
+        print(f"JSON-RPC server listening on {self.host}:{self.port}")
+        if WEBSOCKETS_AVAILABLE:
+            await websockets.serve(self.handle_websocket, self.host, self.port + 1)
+            print(f"WebSocket server listening on {self.host}:{self.port + 1}")
+        async with server:
+            await server.serve_forever()
+
+    async def handle_stream(self, reader, writer):
+        try:
+            while True:
+                try:
+                    line = await reader.readuntil(b'\n')
+                except asyncio.IncompleteReadError as e:
+                    # End of the stream, a last line without a newline is still answered
+                    line = e.partial
+                    if not line:
+                        break
+                except asyncio.LimitOverrunError as e:
+                    # The rest of the line is dropped so the connection stays usable
+                    await self.discard_line(reader, e.consumed)
+                    line = None
+                
+                if line is None:
+                    response = self.error_response(None, -32600, 'Request too large')
+                elif not line.strip():
+                    continue
+                else:
+                    response = await self.dispatch(line)
+                if response is not None:
+                    writer.write(response.encode('utf-8') + b'\n')
+                    await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def discard_line(self, reader, consumed):
+        """Skip the rest of a line longer than the read limit"""
+        while True:
+            await reader.readexactly(consumed)
+            try:
+                await reader.readuntil(b'\n')
+                return
+            except asyncio.LimitOverrunError as e:
+                consumed = e.consumed
+
+    async def handle_websocket(self, websocket, path=None):
+        async for message in websocket:
+            response = await self.dispatch(message)
+            if response is not None:
+                await websocket.send(response)
+
+    async def dispatch(self, raw_request):
+        try:
+            request = json.loads(raw_request)
+        except ValueError:
+            return self.error_response(None, -32700, 'Parse error')
+        if not isinstance(request, dict):
+            return self.error_response(None, -32600, 'Invalid request')
+        
+        request_id = request.get('id')
+        method = self.methods.get(request.get('method'))
+        if method is None:
+            return self.error_response(request_id, -32601, 'Method not found')
+        
+        params = request.get('params') or {}
+        try:
+            inspect.signature(method).bind(**params)
+        except TypeError as e:
+            return self.error_response(request_id, -32602, f'Invalid params: {e}')
+        
+        try:
+            result = await method(**params)
+        except Exception as e:
+            return self.error_response(request_id, -32000, str(e))
+        
+        # Notifications get no response
+        if 'id' not in request:
+            return None
+        return json.dumps({'jsonrpc': '2.0', 'id': request_id, 'result': result})
+
+    def error_response(self, request_id, code, message):
+        return json.dumps({'jsonrpc': '2.0', 'id': request_id, 'error': {'code': code, 'message': message}})
+
+    async def run_blocking(self, function, *args):
+        return await asyncio.get_event_loop().run_in_executor(self.executor, function, *args)
+
+    def get_analysis(self, file_id):
+        if file_id not in self.files:
+            raise ValueError(f"Unknown file: {file_id}")
+        self.files.move_to_end(file_id)
+        return self.files[file_id]
+
+    def evict(self):
+        # The most recently used file stays loaded even if it alone exceeds the budget
+        sizes = {file_id: analysis.estimate_size() for file_id, analysis in self.files.items()}
+        total = sum(sizes.values())
+        while len(self.files) > 1 and total > self.budget_mb * 1024 * 1024:
+            file_id, _ = self.files.popitem(last=False)
+            total -= sizes[file_id]
+
+    def read_file(self, path):
+        with open(path, 'rb') as f:
+            return f.read()
+
+    def parse_file(self, raw):
+        analysis = read_midi_analysis(raw)
+        analysis.get_track_info()
+        return analysis
+
+    async def rpc_load(self, path=None, data=None):
+        """Load a file from a local path or base64 data, returns its id and track summary"""
+        if path:
+            raw = await self.run_blocking(self.read_file, path)
+        elif data:
+            raw = base64.b64decode(data)
+        else:
+            raise ValueError("Either path or data is required")
+        
+        file_id = hashlib.sha1(raw).hexdigest()
+        if file_id not in self.files:
+            self.files[file_id] = await self.run_blocking(self.parse_file, raw)
+            self.evict()
+        return await self.rpc_tracks(file_id)
+
+    async def rpc_unload(self, file_id):
+        """Forget a loaded file, stopping its playback"""
+        await self.rpc_stop(file_id)
+        return self.files.pop(file_id, None) is not None
+
+    async def rpc_tracks(self, file_id):
+        analysis = self.get_analysis(file_id)
+        track_info = await self.run_blocking(analysis.get_track_info)
+        return {
+            'file_id': file_id,
+            'ticks_per_beat': analysis.get_ticks_per_beat(),
+            'tracks': [{'index': i, 'name': name, 'has_notes': has_notes, 'has_lyrics': has_lyrics}
+                       for i, (name, has_notes, has_lyrics) in enumerate(track_info)],
+            # Channels of multi-channel tracks, usable as notes tracks of pairs
+            'voices': [{'index': i, 'track': track_idx, 'name': name}
+                       for i, track_idx, name in await self.run_blocking(analysis.get_voice_info)],
+        }
+
+    async def rpc_suggest_pairs(self, file_id):
+        analysis = self.get_analysis(file_id)
+        track_info = await self.run_blocking(analysis.get_track_info)
+        return [list(pair) for pair in suggest_track_pairs(track_info)]
+
+    async def rpc_notes(self, file_id, track):
+        notes = await self.run_blocking(self.get_analysis(file_id).get_notes, track)
+        return [[tick, [list(note) for note in chord]] for tick, chord in notes]
+
+    async def rpc_lyrics(self, file_id, track):
+        lyrics = await self.run_blocking(self.get_analysis(file_id).get_lyrics, track)
+        return [list(lyric) for lyric in lyrics]
+
+    async def rpc_report(self, file_id, pairs=None):
+        """Alignment report for the given pairs, or for the suggested ones"""
+        analysis = self.get_analysis(file_id)
+        if pairs is None:
+            pairs = await self.rpc_suggest_pairs(file_id)
+        
+        def _report():
+            tolerance = analysis.midi_data.ticks_per_beat // 8
+            reports = []
+            for notes_track, lyrics_track in pairs:
+                notes, lyrics = analysis.get_notes(notes_track), analysis.get_lyrics(lyrics_track)
+                report = build_alignment_report(notes, lyrics, tolerance)
+                report['pair'] = [notes_track, lyrics_track]
+                report['findings'] = [list(finding) for finding in lint_pair(notes, lyrics, tolerance)]
+                reports.append(report)
+            return reports
+        return await self.run_blocking(_report)
+
+    async def rpc_ports(self):
+        return await self.run_blocking(self.port_manager.get_port_names)
+
+    async def rpc_play(self, file_id, pair, port=None, metronome=False):
+        """Play the notes track of a pair to a local MIDI port, returns at once"""
+        if not MIDI_AVAILABLE:
+            raise ValueError("MIDI backend not available")
+        analysis = self.get_analysis(file_id)
+        await self.rpc_stop(file_id)
+        if file_id in self.players:
+            # Two threads sending to the same port would overlap
+            raise ValueError("Previous playback is still stopping")
+        
+        player = PlaybackController()
+        self.players[file_id] = player
+        player.start(lambda: self.play_pair(analysis, pair, port, metronome, player))
+        return True
+
+    async def rpc_stop(self, file_id):
+        player = self.players.get(file_id)
+        # A player whose thread outlives the stop is kept, so the next play waits for it
+        if player and await self.run_blocking(player.stop):
+            self.players.pop(file_id, None)
+        return player is not None
+
+    def play_pair(self, analysis, pair, port_name, metronome, player):
+        notes_track, _ = pair
+        track = analysis.get_track(notes_track)
+        time_signatures, tempo_changes = analysis.get_time_signature_and_tempo()
+        tempo_map = TempoMap(analysis.midi_data.ticks_per_beat, tempo_changes)
         
+        grid = []
+        if metronome:
+            grid = build_metronome_grid(time_signatures, analysis.midi_data.ticks_per_beat, sum(msg.time for msg in track))
+        events = build_playback_events(track, [], None, grid, (76, 77))
+        
+        self.port_manager.get_port_names()
+        output_port = self.port_manager.select(port_name or self.port_manager.get_default_port_name())
+        player.send = output_port.send
+        start_time = time.perf_counter()
+        for tick, kind, msg in events:
+            if kind == 'lyric':
+                continue
+            if not player.wait(max(0.0, start_time + tempo_map.tick_to_seconds(tick) - time.perf_counter())):
+                break
+            player.send_message(msg)
+        # The controller releases the notes still sounding when this returns
+
 if __name__ == '__main__':
-    app = wx.App(False)
-    frame = MidiLyricChecker()
-    frame.Show()
-    app.MainLoop()
\ No newline at end of file
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--server', action='store_true', help='Run the JSON-RPC server instead of the window')
+    parser.add_argument('--port', type=int, default=8765, help='TCP port of the server, WebSocket uses the next one')
+    args = parser.parse_args()
+    
+    if args.server:
+        LyricCheckerServer(port=args.port).run()
+    else:
+        app = wx.App(False)
+        frame = MidiLyricChecker()
+        frame.Show()
+        app.MainLoop()
\ No newline at end of file